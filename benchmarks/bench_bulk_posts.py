@@ -0,0 +1,75 @@
+"""Compare bulk tagging/post generation with the per-song tag_song + generate_post path.
+
+    python benchmarks/bench_bulk_posts.py --songs 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_posts import SongTable, generate_posts, row_tags, tag_groups  # noqa: E402
+from post_text import generate_post, tag_song  # noqa: E402
+
+
+def synthetic_songs(count, seed):
+    rng = random.Random(seed)
+    return [
+        {
+            'title': f"Song Title {i}",
+            'artist': rng.choice(["The Beatles", "Whitney Houston", "Beyoncé", "Prince", "Elton John"]),
+            'slug': f"song-title-{i}",
+            'year': rng.randint(1958, 2024),
+            'peak_rank': rng.randint(1, 100),
+            'weeks_on_chart': rng.randint(1, 60),
+        }
+        for i in range(count)
+    ]
+
+
+class FirstChoice:
+    """Deterministic stand-in for random: no shuffling, always the first option."""
+
+    def shuffle(self, items):
+        pass
+
+    def choice(self, items):
+        return items[0]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    songs = synthetic_songs(args.songs, seed=1)
+    table = SongTable.from_songs(songs)
+
+    # Both paths must agree before their speed is worth comparing.
+    assert row_tags(table, tag_groups(table)) == [tag_song(song) for song in songs]
+    assert generate_posts(table, rng=FirstChoice()) == [generate_post(song, rng=FirstChoice()) for song in songs]
+
+    results = {
+        'per-song tag_song': best_of(args.repeat, lambda: [tag_song(song) for song in songs]),
+        'bulk tag_groups': best_of(args.repeat, lambda: tag_groups(table)),
+        'per-song generate_post': best_of(args.repeat, lambda: [generate_post(song) for song in songs]),
+        'bulk generate_posts': best_of(args.repeat, lambda: generate_posts(table)),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<24} {seconds * 1000:9.2f} ms  {args.songs / seconds:12.0f} songs/s")
+
+
+if __name__ == '__main__':
+    main()
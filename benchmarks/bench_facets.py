@@ -0,0 +1,82 @@
+"""Micro-benchmark for facet byte offsets: single-pass table vs re-encoding each prefix.
+
+    python benchmarks/bench_facets.py --posts 2000
+
+Correctness of the offsets is covered by tests/test_facets.py.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facets import find_facet_spans, find_links, find_mentions, find_tags  # noqa: E402
+from post_text import emoji_map, generate_post  # noqa: E402
+
+EMOJI = list(emoji_map.values()) + ['👩‍🎤', '🇺🇸', '❤️', 'é']
+
+
+def prefix_encode_spans(text):
+    """The previous approach: re-encode text[:i] for every offset (quadratic in post length)."""
+    spans = []
+    for start, end, url in find_links(text):
+        spans.append(('link', len(text[:start].encode('utf-8')), len(text[:end].encode('utf-8')), url))
+    for start, end, tag in find_tags(text):
+        spans.append(('tag', len(text[:start].encode('utf-8')), len(text[:end].encode('utf-8')), tag))
+    for start, end, handle in find_mentions(text):
+        spans.append(('mention', len(text[:start].encode('utf-8')), len(text[:end].encode('utf-8')), handle))
+    spans.sort(key=lambda span: span[1])
+    return spans
+
+
+def sample_posts(count, rng):
+    posts = []
+    for i in range(count):
+        song = {
+            'title': ''.join(rng.choice(EMOJI) for _ in range(rng.randint(0, 3))) + f" Song {i}",
+            'artist': rng.choice(["Beyoncé", "Sinéad O'Connor", "Prince", "Mötley Crüe", "Björk"]),
+            'slug': f"song-{i}",
+            'year': rng.randint(1958, 2024),
+            'peak_rank': rng.randint(1, 100),
+            'weeks_on_chart': rng.randint(1, 60),
+        }
+        post = generate_post(song, rng=rng)
+        # Sprinkle in extra emoji, tags, chart positions and a mention.
+        extras = [rng.choice(EMOJI), '#1', '#Hot100!', '@pophits.bsky.social', rng.choice(EMOJI) * 3]
+        posts.append(post + ' ' + ' '.join(rng.sample(extras, 3)))
+    return posts
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    posts = sample_posts(args.posts, rng)
+
+    long_text = ' '.join(f"#tag{i} {rng.choice(EMOJI)}" for i in range(2000))
+    cases = {
+        'posts': lambda f: [f(text) for text in posts],
+        'one 2000-tag text': lambda f: f(long_text),
+    }
+    for case, run in cases.items():
+        single = best_of(args.repeat, lambda: run(find_facet_spans))
+        prefix = best_of(args.repeat, lambda: run(prefix_encode_spans))
+        print(f"{case:<18} single-pass {single * 1000:9.2f} ms   prefix re-encode {prefix * 1000:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Guard start-up cost: measure `import bluesky_song_poster` with `python -X importtime`.
+
+    python benchmarks/bench_import_time.py --budget-ms 100
+
+Fails (exit status 1) if importing the entry point pulls in a heavy
+dependency that should only load in the stage that needs it, or if the
+cumulative import time is over budget (best of --repeat runs). The import
+runs against the same state directory cron uses (POPHITS_STATE_DIR or
+./state, or --state-dir), so state opened at import time is measured too.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ('requests', 'atproto', 'atproto_client', 'PIL', 'asyncio')
+
+
+def measure(module, state_dir):
+    """Return (cumulative microseconds for `module`, {direct child: microseconds}, set of imported modules)."""
+    env = dict(os.environ, POPHITS_STATE_DIR=state_dir)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr}")
+
+    # Lines look like "import time:   self |   cumulative |   name", with the
+    # name indented two spaces per nesting level. A module's line comes after
+    # the lines of everything it imported.
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, raw_name = line[len('import time:'):].split('|')
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        entries.append((depth, raw_name.strip(), int(cumulative)))
+
+    index = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    start = index
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    children = {name: micros for depth, name, micros in entries[start:index] if depth == 1}
+    imported = {name for _, name, _ in entries[start:index + 1]}
+    return entries[index][2], children, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='bluesky_song_poster')
+    parser.add_argument('--budget-ms', type=float, default=100.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Show the slowest N direct imports.')
+    parser.add_argument('--state-dir', default=os.environ.get('POPHITS_STATE_DIR', os.path.join(ROOT, 'state')))
+    args = parser.parse_args()
+
+    runs = [measure(args.module, args.state_dir) for _ in range(args.repeat)]
+    total, children, imported = min(runs, key=lambda run: run[0])
+    total_ms = total / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms cumulative (best of {args.repeat}, budget {args.budget_ms:.0f} ms)")
+    for name, micros in sorted(children.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failures = []
+    eager = sorted(m for m in LAZY_MODULES if m in imported)
+    if eager:
+        failures.append(f"heavy modules imported at start-up: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""Offline replay benchmark: run the real posting pipeline against local stand-ins.
+
+A local HTTP server plays PopHits, MusicBrainz and the Cover Art Archive from
+recorded fixtures (benchmarks/fixtures/songs.json), and a fake atproto client
+stands in for Bluesky. Latency, error rate and image size are configurable,
+so caching and concurrency changes can be measured without network access.
+
+    python benchmarks/replay.py --runs 20 --latency pophits=50 --latency musicbrainz=300 \\
+        --latency caa=80 --latency bluesky=150 --error-rate 0.05 --image-size 2000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'songs.json')
+SERVICES = ('pophits', 'musicbrainz', 'caa', 'bluesky')
+
+
+def normalize(value):
+    return re.sub(r'[^a-z0-9]+', ' ', value.lower()).strip()
+
+
+def make_jpeg(size, seed=0):
+    """A noisy JPEG, so it compresses about as badly as real cover art."""
+    from PIL import Image
+
+    image = Image.frombytes('RGB', (size, size), random.Random(seed).randbytes(3 * size * size))
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+class StandIns:
+    """Shared state for the stand-in HTTP handler: fixtures, latency, errors and request counts."""
+
+    def __init__(self, songs, latency, error_rate, image_bytes, seed):
+        self.songs = songs
+        self.by_mbid = {s['mbid']: s for s in songs if s['mbid']}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.image_bytes = image_bytes
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {service: 0 for service in SERVICES}
+
+    def hit(self, service):
+        with self.lock:
+            self.requests[service] += 1
+            fail = self.rng.random() < self.error_rate
+        time.sleep(self.latency.get(service, 0) / 1000)
+        return fail
+
+    def find_song(self, query):
+        quoted = [normalize(q) for q in re.findall(r'"([^"]*)"', query)]
+        for song in self.songs:
+            title, artist = normalize(song['title']), normalize(song['artist'])
+            if any(q and q in title for q in quoted) and any(q and q in artist for q in quoted):
+                return song
+        return None
+
+
+def release_json(song):
+    return {
+        'id': song['mbid'],
+        'score': 100,
+        'title': song['title'],
+        'artist-credit': [{'name': song['artist'], 'artist': {'name': song['artist']}}],
+        'release-group': {'primary-type': 'Single'},
+        'cover-art-archive': {'artwork': song['has_cover_art'], 'front': song['has_cover_art'],
+                              'count': 1 if song['has_cover_art'] else 0},
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body=b'', content_type='application/json', headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def send_json(self, data):
+            self.send(200, json.dumps(data).encode())
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path, params = url.path, parse_qs(url.query)
+            service = ('pophits' if path.startswith('/api/') else
+                       'musicbrainz' if path.startswith('/ws/2/') else 'caa')
+            if state.hit(service):
+                return self.send(503, b'{"error": "stand-in failure"}', headers={'Retry-After': '0'})
+
+            if path == '/api/songs/random-song/':
+                return self.send_json(state.rng.choice(state.songs))
+            if path == '/api/songs/':
+                page = int(params.get('page', ['1'])[0])
+                per_page = 10
+                results = state.songs[(page - 1) * per_page:page * per_page]
+                more = page * per_page < len(state.songs)
+                base = f"http://{self.headers['Host']}/api/songs/"
+                return self.send_json({'count': len(state.songs), 'results': results,
+                                       'next': f"{base}?page={page + 1}" if more else None})
+            if path in ('/ws/2/release/', '/ws/2/release'):
+                song = state.find_song(unquote(params.get('query', [''])[0]))
+                releases = [release_json(song)] if song and song['mbid'] else []
+                return self.send_json({'count': len(releases), 'releases': releases})
+            if path in ('/ws/2/recording/', '/ws/2/recording'):
+                song = state.find_song(unquote(params.get('query', [''])[0]))
+                recordings = []
+                if song and song['mbid']:
+                    recordings = [{'id': song['slug'], 'score': 100, 'title': song['title'],
+                                   'artist-credit': [{'name': song['artist']}],
+                                   'releases': [release_json(song)]}]
+                return self.send_json({'count': len(recordings), 'recordings': recordings})
+            match = re.match(r'^/release/([^/]+)/front(?:-\d+)?$', path)
+            if match:
+                song = state.by_mbid.get(match.group(1))
+                if not song or not song['has_cover_art']:
+                    return self.send(404, b'', content_type='text/plain')
+                return self.send(307, b'', headers={'Location': f"/images/{song['mbid']}.jpg"})
+            if path.startswith('/images/'):
+                return self.send(200, state.image_bytes, content_type='image/jpeg')
+            return self.send(404, b'', content_type='text/plain')
+
+    return Handler
+
+
+class FakeBluesky:
+    """Stand-in for the Bluesky PDS behind FakeBlueskyClient: sessions, blobs and post records.
+
+    Every call goes through `state.hit('bluesky')`, so it is counted, delayed
+    by the bluesky latency and can fail like the HTTP stand-ins.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.sessions = set()
+        self.records = {}
+        self.posts = []
+        self.uploaded_bytes = 0
+        self.lock = threading.Lock()
+
+    def call(self):
+        from atproto.exceptions import NetworkError
+
+        if self.state.hit('bluesky'):
+            raise NetworkError()
+
+
+class FakeBlueskyClient:
+    """Stands in for atproto.Client, so the real bluesky_session.login() runs against FakeBluesky."""
+
+    def __init__(self, service):
+        self.service = service
+        self.callbacks = []
+        self.session_string = None
+        self.me = None
+        self.app = SimpleNamespace(bsky=SimpleNamespace(feed=SimpleNamespace(
+            post=SimpleNamespace(create=self.create_post, get=self.get_post))))
+
+    def on_session_change(self, callback):
+        self.callbacks.append(callback)
+
+    def login(self, login=None, password=None, session_string=None):
+        from atproto import SessionEvent
+        from atproto.exceptions import UnauthorizedError
+
+        self.service.call()
+        if session_string:
+            if session_string not in self.service.sessions:
+                raise UnauthorizedError()
+            event = SessionEvent.IMPORT
+        else:
+            session_string = f"replay-session-{login}-{len(self.service.sessions)}"
+            with self.service.lock:
+                self.service.sessions.add(session_string)
+            event = SessionEvent.CREATE
+        self.session_string = session_string
+        self.me = SimpleNamespace(did='did:plc:replay', handle=login)
+        for callback in self.callbacks:
+            callback(event, SimpleNamespace(export=lambda: session_string))
+
+    def export_session_string(self):
+        return self.session_string
+
+    def upload_blob(self, data):
+        from atproto_client.models.blob_ref import BlobRef, IpldLink
+
+        self.service.call()
+        with self.service.lock:
+            self.service.uploaded_bytes += len(data)
+        blob = BlobRef(mime_type='image/jpeg', size=len(data),
+                       ref=IpldLink(link='bafkreibme22gw2h7y2h7tg2fhqotaqjucnbc24deqo72b6mkl2egezxhvy'))
+        return SimpleNamespace(blob=blob)
+
+    def get_current_time_iso(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def create_post(self, repo, record, rkey=None):
+        from atproto.exceptions import BadRequestError
+
+        self.service.call()
+        with self.service.lock:
+            if rkey in self.service.records:
+                raise BadRequestError()
+            uri = f"at://{repo}/app.bsky.feed.post/{rkey}"
+            self.service.records[rkey] = SimpleNamespace(uri=uri, cid='bafyreplay', value=record)
+            self.service.posts.append(record.text)
+        return SimpleNamespace(uri=uri, cid='bafyreplay')
+
+    def get_post(self, repo, rkey):
+        from atproto.exceptions import BadRequestError
+
+        self.service.call()
+        with self.service.lock:
+            record = self.service.records.get(rkey)
+        if record is None:
+            raise BadRequestError()
+        return record
+
+
+def parse_latency(values):
+    latency = {service: 0 for service in SERVICES}
+    for value in values or []:
+        service, _, ms = value.partition('=')
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service {service!r}; expected one of {', '.join(SERVICES)}")
+        latency[service] = float(ms)
+    return latency
+
+
+def read_jsonl(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--candidates', type=int, default=5)
+    parser.add_argument('--latency', action='append', metavar='SERVICE=MS',
+                        help=f"Added latency per request for one of: {', '.join(SERVICES)}. Can be repeated.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of HTTP requests answered with 503.')
+    parser.add_argument('--image-size', type=int, default=1200, help='Edge length in px of the served cover art.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dry-run', action='store_true', help='Stop before the (fake) Bluesky upload and post.')
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON.')
+    parser.add_argument('extra', nargs=argparse.REMAINDER,
+                        help='Extra arguments passed to bluesky_song_poster.main(), after "--".')
+    args = parser.parse_args()
+
+    latency = parse_latency(args.latency)
+    with open(FIXTURES) as f:
+        songs = json.load(f)
+    state = StandIns(songs, latency, args.error_rate, make_jpeg(args.image_size, args.seed), args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    state_dir = tempfile.mkdtemp(prefix='pophits-replay-')
+    os.environ.update({
+        'POPHITS_STATE_DIR': state_dir,
+        'POPHITS_API_BASE': f"{base}/api",
+        'MUSICBRAINZ_API_BASE': f"{base}/ws/2",
+        'COVER_ART_ARCHIVE_BASE': base,
+        'POPHITS_BLUESKY_USERNAME': 'replay.bsky.social',
+        'POPHITS_BLUESKY_PASSWORD': 'replay',
+        'POPHITS_SONG_REPOST_DAYS': '0',
+        'POPHITS_ARTIST_REPOST_DAYS': '0',
+        'POPHITS_METRICS_JSONL': os.path.join(state_dir, 'metrics.jsonl'),
+        'POPHITS_REMAINING_YEARS_FILE': os.path.join(state_dir, 'remaining_years.json'),
+    })
+    random.seed(args.seed)
+
+    import bluesky_song_poster as poster
+    from metrics import metrics
+
+    import atproto
+
+    # bluesky_session.login() imports Client from atproto when it runs, so the
+    # real login and session reuse code is exercised against the stand-in.
+    bluesky = FakeBluesky(state)
+    atproto.Client = lambda *args, **kwargs: FakeBlueskyClient(bluesky)
+
+    argv = ['bluesky_song_poster.py', '--candidates', str(args.candidates)]
+    if args.dry_run:
+        argv.append('--dry-run')
+    argv += [a for a in args.extra if a != '--']
+
+    durations = []
+    snapshots = []
+    exported = 0
+    saved_argv, saved_stdout = sys.argv, sys.stdout
+    try:
+        for _ in range(args.runs):
+            # Each run starts from empty metrics, as a fresh cron process would.
+            metrics.reset()
+            sys.argv, sys.stdout = argv, io.StringIO()
+            start = time.perf_counter()
+            try:
+                poster.main()
+            finally:
+                sys.argv, sys.stdout = saved_argv, saved_stdout
+            durations.append(time.perf_counter() - start)
+            # Every posting run (every publish in schedule mode) appends a snapshot
+            # to the JSONL. Commands that export nothing, like sync-catalog, are
+            # reported from the collector instead.
+            runs = read_jsonl(os.environ['POPHITS_METRICS_JSONL'])
+            if len(runs) > exported:
+                snapshots += runs[exported:]
+                exported = len(runs)
+            else:
+                snapshots.append(metrics.snapshot())
+    finally:
+        server.shutdown()
+
+    outcomes, stages, cache = {}, {}, {}
+    for run in snapshots:
+        outcome = run['outcome'] or 'none'
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        for name, stage in run['stages'].items():
+            total = stages.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'errors': 0})
+            for key in total:
+                total[key] += stage[key]
+        for name, result in run['cache'].items():
+            total = cache.setdefault(name, {'hits': 0, 'misses': 0})
+            total['hits'] += result['hits']
+            total['misses'] += result['misses']
+    total = sum(durations)
+    report = {
+        'runs': args.runs,
+        'outcomes': outcomes,
+        'throughput_runs_per_second': args.runs / total if total else None,
+        'end_to_end_seconds': {
+            'mean': statistics.mean(durations),
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'max': max(durations),
+        },
+        'stages': {
+            name: dict(stage, mean_seconds=stage['total_seconds'] / stage['count'] if stage['count'] else None)
+            for name, stage in stages.items()
+        },
+        'cache': cache,
+        'stand_in_requests': state.requests,
+        'uploaded_bytes': bluesky.uploaded_bytes,
+        'posts': len(bluesky.posts),
+        'state_dir': state_dir,
+    }
+
+    e2e = report['end_to_end_seconds']
+    print(f"runs: {args.runs}  outcomes: {outcomes}  throughput: {report['throughput_runs_per_second']:.2f} runs/s")
+    print(f"end-to-end: mean {e2e['mean'] * 1000:.0f} ms  p50 {e2e['p50'] * 1000:.0f} ms  "
+          f"p95 {e2e['p95'] * 1000:.0f} ms  max {e2e['max'] * 1000:.0f} ms")
+    print(f"{'stage':<22}{'count':>7}{'errors':>8}{'mean ms':>10}{'total ms':>11}")
+    for name, stage in sorted(report['stages'].items()):
+        print(f"{name:<22}{stage['count']:>7}{stage['errors']:>8}"
+              f"{(stage['mean_seconds'] or 0) * 1000:>10.1f}{stage['total_seconds'] * 1000:>11.1f}")
+    for name, cache in sorted(report['cache'].items()):
+        print(f"cache {name}: {cache['hits']} hits / {cache['misses']} misses")
+    print(f"stand-in requests: {state.requests}  uploaded bytes: {bluesky.uploaded_bytes}  posts: {len(bluesky.posts)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import os
+
+
+def load_session_string(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_session_string(path, session_string):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(session_string)
+    os.replace(tmp_path, path)
+
+
+def login(username, password, session_path):
+    """Return a logged-in Client, reusing the session saved at `session_path` when it is still valid.
+
+    Token refreshes are written back to `session_path`, so a long-running
+    process or the next cron run never needs a fresh password login.
+    """
+    from atproto import Client, SessionEvent
+
+    client = Client()
+
+    def on_session_change(event, session):
+        if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            save_session_string(session_path, session.export())
+
+    client.on_session_change(on_session_change)
+
+    session_string = load_session_string(session_path)
+    if session_string:
+        try:
+            client.login(session_string=session_string)
+            return client
+        except Exception as e:
+            print(f"⚠️ Saved Bluesky session could not be reused ({e}); logging in again.")
+
+    client.login(username, password)
+    save_session_string(session_path, client.export_session_string())
+    return client
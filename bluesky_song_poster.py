@@ -1,207 +1,523 @@
-import requests
+# Heavy dependencies (requests, atproto, PIL, asyncio) are imported inside the
+# functions that use them, so runs that never reach a stage don't pay for it.
 import argparse
-import random
-from atproto import Client
 import os
 from dotenv import load_dotenv
-from atproto import models as atproto_models
-from datetime import datetime
-import re
-import io
-from PIL import Image
+import time
 
-from templates import TEMPLATES as template_map, FALLBACK_TEMPLATES as fallback_templates
+from post_text import tag_song, emoji_map, generate_hashtags, generate_post
+from lookup_cache import LookupCache, MISS, DEFAULT_NEGATIVE_TTL
+from catalog import ALL_SONGS, SongCatalog, year_bucket
+from year_rotation import YearRotation
+from posted_ledger import PostedLedger
+import http_client
+from cover_art import prepare_cover_art, ImageCache, CoverArtError
+from musicbrainz import ReleaseMatcher
+from scheduler import PostScheduler, BLOB_MAX_AGE
+from outbox import Outbox, PREPARED, BLOB_UPLOADED
+from template_selection import TemplateSelector, FALLBACK_TAG
+from template_engine import TAG_POOLS, FALLBACK_POOL
+from cache_warmer import CacheWarmer
+from facets import build_facets
+from fan_out import load_feeds, feed_tag_weights, publish_all
+from metrics import metrics, export
 
 load_dotenv()
 
 POPHITS_BLUESKY_USERNAME = os.environ.get('POPHITS_BLUESKY_USERNAME')
 POPHITS_BLUESKY_PASSWORD = os.environ.get('POPHITS_BLUESKY_PASSWORD')
 YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY')
+STATE_DIR = os.environ.get(
+    'POPHITS_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state')
+)
+# Service endpoints; overridable so the pipeline can run against local stand-ins (see benchmarks/replay.py).
+POPHITS_API_BASE = os.environ.get('POPHITS_API_BASE', 'https://pophits.org/api').rstrip('/')
+MUSICBRAINZ_API_BASE = os.environ.get('MUSICBRAINZ_API_BASE', 'https://musicbrainz.org/ws/2').rstrip('/')
+COVER_ART_ARCHIVE_BASE = os.environ.get('COVER_ART_ARCHIVE_BASE', 'https://coverartarchive.org').rstrip('/')
+CATALOG_URL = os.environ.get('POPHITS_CATALOG_URL', f"{POPHITS_API_BASE}/songs/")
+CANDIDATE_COUNT = int(os.environ.get('POPHITS_CANDIDATE_COUNT', '5'))
+CATALOG_DRAW_ATTEMPTS = 20
+WARM_CACHE_WORKERS = int(os.environ.get('POPHITS_WARM_CACHE_WORKERS', '4'))
+REMAINING_YEARS_FILE = os.environ.get(
+    'POPHITS_REMAINING_YEARS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remaining_years.json')
+)
+METRICS_JSONL = os.environ.get('POPHITS_METRICS_JSONL')
+METRICS_TEXTFILE = os.environ.get('POPHITS_METRICS_TEXTFILE')
+# Running totals behind the textfile's stage latency histograms.
+METRICS_HISTOGRAMS = os.environ.get(
+    'POPHITS_METRICS_HISTOGRAMS', os.path.join(STATE_DIR, 'metrics_histograms.json')
+)
+SCHEDULE_INTERVAL = float(os.environ.get('POPHITS_SCHEDULE_INTERVAL', str(6 * 3600)))
+FEEDS_FILE = os.environ.get(
+    'POPHITS_FEEDS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feeds.json')
+)
+# Cover Art Archive thumbnail size: 250, 500 or 1200.
+COVER_ART_SIZE = os.environ.get('POPHITS_COVER_ART_SIZE', '1200')
 
-def tag_song(song):
-    tags = []
-    year = song["year"]
-    peak = song["peak_rank"]
-    weeks = song["weeks_on_chart"]
-
-    if peak == 1:
-        tags.append("number_one")
-    elif peak <= 10:
-        tags.append("top_ten")
-    if weeks >= 30:
-        tags.append("longevity")
-    if weeks < 5:
-        tags.append("short_run")
-    if year <= datetime.now().year - 50:
-        tags.append("timeless")
-    if 1960 <= year < 1970:
-        tags.append("sixties")
-    elif 1970 <= year < 1980:
-        tags.append("seventies")
-    elif 1980 <= year < 1990:
-        tags.append("eighties")
-    elif 1990 <= year < 2000:
-        tags.append("nineties")
-    elif 2000 <= year < 2010:
-        tags.append("two_thousands")
-    return tags
-
-emoji_map = {
-    "number_one": "🏆",
-    "top_ten": "🔥",
-    "longevity": "📈",
-    "short_run": "💨",
-    "timeless": "🎶",
-    "sixties": "🕺",
-    "seventies": "🌈",
-    "eighties": "🎧",
-    "nineties": "💿",
-    "two_thousands": "📻",
-}
-
-def generate_hashtags(song):
-    base_tags = ["#pophits", "#Hot100", "#Billboard"]
-    artist_tag = f"#" + re.sub(r'[^a-zA-Z0-9]', '', song['artist'])
-    return " ".join(base_tags + [artist_tag])
-
-def generate_post(song):
-    tags = tag_song(song)
-    random.shuffle(tags)
-    template_used = None
-    text = ""
-    available_length = 280 - len(f" Check it out at https://pophits.org/songs/{song['slug']}!\\n#pophits #Hot100 #Billboard")
-    chosen_template = None
-
-    for tag in tags:
-        templates = template_map.get(tag)
-        if templates:
-            emoji = emoji_map.get(tag, "")
-            template = random.choice(templates)
-            new_text = template.format(
-                title=song["title"],
-                artist=song["artist"],
-                year=song["year"],
-                peak_rank=song["peak_rank"],
-                weeks_on_chart=song["weeks_on_chart"],
-                emoji=emoji
-            )
-            if len(text) + len(new_text) <= available_length:
-                if new_text not in text:
-                    text = new_text
-                    template_used = tag
-                    chosen_template = template
-            else:
-                break
-
-    if not template_used:
-        template = random.choice(fallback_templates)
-        emoji = ""
-        text = template.format(
-            title=song["title"],
-            artist=song["artist"],
-            year=song["year"],
-            peak_rank=song["peak_rank"],
-            weeks_on_chart=song["weeks_on_chart"],
+# State under STATE_DIR is opened on first use, so start-up doesn't pay for it.
+def get_lookup_cache():
+    global _lookup_cache
+    if _lookup_cache is None:
+        _lookup_cache = LookupCache(
+            os.path.join(STATE_DIR, 'lookup_cache.sqlite3'),
+            negative_ttl=int(os.environ.get('POPHITS_NEGATIVE_CACHE_TTL', DEFAULT_NEGATIVE_TTL)),
         )
-        chosen_template = template
-
-    # Ensure artist, year, and chart performance are always included
-    if "{artist}" not in chosen_template and "{title}" not in chosen_template:
-        text = f'"{song["title"]}" by {song["artist"]} {text}'
-    if "{year}" not in chosen_template:
-        text = f'{text} Released in {song["year"]}'
-    if "{peak_rank}" not in chosen_template:
-        text = f'{text} Peaked at #{song["peak_rank"]} on the charts'
-
-    # No YouTube URL fallback needed - we only post with images now
-
-    link = f"https://pophits.org/songs/{song['slug']}"
-    hashtags = generate_hashtags(song)
-    if len(text) + len(f" Check it out at {link}!\n{hashtags}") <= 300:
-        return f"{text} Check it out at {link}!\n{hashtags}"
-    else:
-        return text
-
-def get_random_song():
-    """Fetch a random song from PopHits API; only return if cover art is available."""
-    def get_musicbrainz_release_id(artist, track):
-        base_url = "https://musicbrainz.org/ws/2/release/"
-        query = f'recording:"{track}" AND artist:"{artist}" AND primarytype:single'
-        url = f"{base_url}?query={query}&fmt=json"
-        headers = {
-            'User-Agent': 'PopHits Bluesky Automation Script (pophits.org)'
-        }
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            if data and 'releases' in data and len(data['releases']) > 0:
-                return data['releases'][0]['id']
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error querying MusicBrainz: {e}")
+    return _lookup_cache
+
+_lookup_cache = None
+
+def get_musicbrainz_release_id(artist, track):
+    cached = get_lookup_cache().get_release_id(artist, track)
+    metrics.cache_result('musicbrainz_release', cached is not MISS)
+    if cached is not MISS:
+        return cached
+
+    import requests
+
+    try:
+        with metrics.stage('musicbrainz_search'):
+            mbid = release_matcher.find_release(artist, track)
+    except requests.exceptions.RequestException as e:
+        # Transient failures are not cached, so the pair is retried next time.
+        print(f"Error querying MusicBrainz: {e}")
+        return None
+    get_lookup_cache().put_release_id(artist, track, mbid)
+    return mbid
+
+def get_cover_art_url(mbid):
+    """Return the Cover Art Archive thumbnail URL for a release, or None if it has no front image.
+
+    Probes with a HEAD request without following the redirect to archive.org,
+    so the image itself is only downloaded once, when the post is made.
+    """
+    cached = get_lookup_cache().get_has_front_art(mbid)
+    metrics.cache_result('cover_art_probe', cached is not MISS)
+    if cached is not MISS:
+        return cover_art_thumbnail_url(mbid) if cached else None
+
+    import requests
+
+    url = cover_art_thumbnail_url(mbid)
+    print(f"Querying Cover Art Archive with MBID: {mbid}")
+    try:
+        with metrics.stage('cover_art_probe'):
+            response = http_client.head(url, allow_redirects=False)
+        if response.status_code == 200 or response.is_redirect:
+            cover_art_url = url
+        elif response.status_code == 404:
+            cover_art_url = None
+        else:
             return None
+    except requests.exceptions.RequestException as e:
+        print(f"Error querying Cover Art Archive: {e}")
+        return None
+    finally:
+        print(
+            f"Cover Art Archive query for MBID {mbid} returned status code: "
+            f"{response.status_code if 'response' in locals() else 'No Response'}"
+        )
+    get_lookup_cache().put_has_front_art(mbid, cover_art_url is not None)
+    return cover_art_url
 
-    def get_cover_art_url(mbid):
-        base_url = "https://coverartarchive.org/release/"
-        url = f"{base_url}{mbid}/front"
-        print(f"Querying Cover Art Archive with MBID: {mbid}")
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return url
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error querying Cover Art Archive: {e}")
+def cover_art_thumbnail_url(mbid):
+    return f"{COVER_ART_ARCHIVE_BASE}/release/{mbid}/front-{COVER_ART_SIZE}"
+
+def probe_cover_art(mbid, front_flag):
+    """Cover art lookup for the release matcher, trusting the search result's `cover-art-archive` flag when given."""
+    if front_flag is None:
+        return get_cover_art_url(mbid)
+    get_lookup_cache().put_has_front_art(mbid, front_flag)
+    return cover_art_thumbnail_url(mbid) if front_flag else None
+
+release_matcher = ReleaseMatcher(MUSICBRAINZ_API_BASE, probe_cover_art)
+
+def get_image_cache():
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = ImageCache(os.path.join(STATE_DIR, 'images'))
+    return _image_cache
+
+_image_cache = None
+
+# Outbox account name for the POPHITS_BLUESKY_USERNAME account; fan-out feeds use their own names.
+DEFAULT_ACCOUNT = 'default'
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox(os.path.join(STATE_DIR, 'outbox.sqlite3'))
+    return _outbox
+
+_outbox = None
+
+def get_template_selector():
+    global _template_selector
+    if _template_selector is None:
+        _template_selector = TemplateSelector(os.path.join(STATE_DIR, 'template_usage.sqlite3'))
+    return _template_selector
+
+_template_selector = None
+
+def parse_song(data):
+    """Turn a PopHits API song record into the song dict used throughout this script."""
+    return {
+        "title": data['title'],
+        "artist": data['artist'] if isinstance(data['artist'], str) else data['artist']['name'],
+        "year": int(data['year']),
+        "peak_rank": int(data['peak_rank']),
+        "weeks_on_chart": int(data.get('weeks_on_chart') or 0),
+        "slug": data['slug'],
+    }
+
+def fetch_random_song():
+    """Fetch a random song from the PopHits API, without any cover art lookup."""
+    import requests
+
+    url = f"{POPHITS_API_BASE}/songs/random-song/"
+    try:
+        with metrics.stage('pophits_random_song'):
+            response = http_client.get(url)
+            response.raise_for_status()
+        return parse_song(response.json())
+    except requests.exceptions.RequestException as e:
+        print(f"Error retrieving random song: {e}")
+        return None
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error parsing random song API response: {e}")
+        return None
+
+def resolve_cover_art(song):
+    """Attach cover art to a song; returns None if the song has no usable cover art."""
+    mbid = get_musicbrainz_release_id(song["artist"], song["title"])
+    cover_art_url = None
+    if mbid:
+        cover_art_url = get_cover_art_url(mbid)
+
+    if not cover_art_url:
+        print(f"⚠️ No cover art found for '{song['title']}' by {song['artist']}. Skipping candidate.")
+        return None
+
+    return dict(song, mbid=mbid, cover_art_url=cover_art_url)
+
+async def find_song_with_cover_art(candidates, executor):
+    """Run `candidates` fetch-and-resolve pipelines at once and return the first that qualifies."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    seen_slugs = set()
+
+    async def resolve_candidate():
+        song = await loop.run_in_executor(executor, fetch_random_song)
+        if not song or song["slug"] in seen_slugs:
             return None
-        finally:
-            print(
-                f"Cover Art Archive query for MBID {mbid} returned status code: "
-                f"{response.status_code if 'response' in locals() else 'No Response'}"
-            )
+        seen_slugs.add(song["slug"])
+        reason = get_posted_ledger().rejection_reason(song)
+        if reason:
+            print(f"⏭️ Skipping '{song['title']}' by {song['artist']}: {reason}.")
+            return None
+        return await loop.run_in_executor(executor, resolve_cover_art, song)
 
-    url = "https://pophits.org/api/songs/random-song/"
+    tasks = [asyncio.ensure_future(resolve_candidate()) for _ in range(candidates)]
     try:
-        response = requests.get(url)
+        for next_done in asyncio.as_completed(tasks):
+            song = await next_done
+            if song:
+                return song
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = SongCatalog(os.path.join(STATE_DIR, 'catalog.sqlite3'))
+    return _catalog
+
+_catalog = None
+
+def get_posted_ledger():
+    global _posted_ledger
+    if _posted_ledger is None:
+        _posted_ledger = PostedLedger(
+            os.path.join(STATE_DIR, 'posted.sqlite3'),
+            slug_window_days=int(os.environ.get('POPHITS_SONG_REPOST_DAYS', '365')),
+            artist_window_days=int(os.environ.get('POPHITS_ARTIST_REPOST_DAYS', '14')),
+        )
+    return _posted_ledger
+
+_posted_ledger = None
+
+def fetch_catalog_pages():
+    """Yield every song record from the PopHits song list API, following pagination."""
+    url = CATALOG_URL
+    while url:
+        response = http_client.get(url)
         response.raise_for_status()
         data = response.json()
+        if isinstance(data, list):
+            yield from data
+            return
+        yield from data.get('results', [])
+        url = data.get('next')
 
-        song_title = data['title']
-        artist_name = data['artist'] if isinstance(data['artist'], str) else data['artist']['name']
-        year = data['year']
-        peak_rank = data['peak_rank']
-        slug = data['slug']
-        weeks_on_chart = data.get('weeks_on_chart', 0)
-
-        mbid = get_musicbrainz_release_id(artist_name, song_title)
-        cover_art_url = None
-        if mbid:
-            cover_art_url = get_cover_art_url(mbid)
-
-        # Only return song if cover art is available
-        if not cover_art_url:
-            print(f"⚠️ No cover art found for '{song_title}' by {artist_name}. Skipping post.")
-            return None
+def apply_cached_eligibility(catalog, song):
+    """Fill in a song's eligibility from the lookup cache; returns False if it is still unknown."""
+    mbid = get_lookup_cache().get_release_id(song["artist"], song["title"])
+    if mbid is MISS:
+        return False
+    has_front = False
+    if mbid:
+        has_front = get_lookup_cache().get_has_front_art(mbid)
+        if has_front is MISS:
+            return False
+    catalog.set_eligibility(song["slug"], mbid, has_front)
+    return True
 
-        song = {
-            "title": song_title,
-            "artist": artist_name,
-            "year": year,
-            "peak_rank": peak_rank,
-            "weeks_on_chart": weeks_on_chart,
-            "slug": slug,
-            "cover_art_url": cover_art_url,
-        }
-        return song
+def sync_catalog(resolve=False):
+    """Bulk-sync PopHits song metadata and tags into the local catalog and rebuild its draw index."""
+    import requests
+
+    catalog = get_catalog()
+    synced = unresolved = 0
+    try:
+        for record in fetch_catalog_pages():
+            try:
+                song = parse_song(record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping malformed catalog record: {e}")
+                continue
+            catalog.upsert_song(song, tag_song(song))
+            if not apply_cached_eligibility(catalog, song):
+                if resolve:
+                    resolved = resolve_cover_art(song)
+                    if resolved:
+                        catalog.set_eligibility(song["slug"], resolved["mbid"], True)
+                    else:
+                        apply_cached_eligibility(catalog, song)
+                else:
+                    unresolved += 1
+            synced += 1
+            if synced % 500 == 0:
+                catalog.commit()
+                print(f"Synced {synced} songs...")
     except requests.exceptions.RequestException as e:
-        print(f"Error retrieving random song: {e}")
+        print(f"Error retrieving song catalog: {e}")
+    finally:
+        catalog.commit()
+    eligible = catalog.rebuild_draw_index()
+    print(f"✅ Synced {synced} songs; {eligible} eligible, {unresolved} without cover art info yet.")
+
+def warm_cache(workers=WARM_CACHE_WORKERS, restart=False, sync=True):
+    """Resolve MBIDs and cover art for every catalog song ahead of time, resumably.
+
+    Results land in the lookup cache and the catalog's eligibility flags, so
+    live runs with --catalog become pure cache lookups.
+    """
+    if sync:
+        sync_catalog()
+    catalog = get_catalog()
+    warmer = CacheWarmer(os.path.join(STATE_DIR, 'warm_cache_checkpoint.json'), workers=workers,
+                         on_checkpoint=catalog.commit)
+    if restart:
+        warmer.reset()
+
+    def work(song):
+        resolve_cover_art(song)
+        return apply_cached_eligibility(catalog, song)
+
+    songs = catalog.songs(only_unresolved=True)
+    print(f"Warming cover art for {len(songs)} unresolved songs with {workers} workers...")
+    finished, retry_later, interrupted = warmer.run(songs, key=lambda song: song["slug"], work=work)
+    eligible = catalog.rebuild_draw_index()
+    if interrupted:
+        print(f"⏸️ Stopped after {finished} songs; run warm-cache again to resume.")
+    else:
+        warmer.reset()
+        print(f"✅ Warmed {finished} songs ({retry_later} failed and will be retried); {eligible} eligible.")
+
+def parse_tag_weights(values):
+    weights = {}
+    for value in values or []:
+        tag, _, weight = value.partition('=')
+        weights[tag] = float(weight) if weight else 1.0
+    return weights
+
+def get_year_rotation():
+    global _year_rotation
+    if _year_rotation is None:
+        _year_rotation = YearRotation(REMAINING_YEARS_FILE)
+    return _year_rotation
+
+_year_rotation = None
+
+def draw_catalog_song(catalog, tag_weights=None, year=None):
+    for _ in range(CATALOG_DRAW_ATTEMPTS):
+        song = catalog.draw(tag_weights, year=year)
+        if not song:
+            return None
+        if not get_posted_ledger().rejection_reason(song):
+            return dict(song, cover_art_url=cover_art_thumbnail_url(song["mbid"]))
+    return None
+
+def draw_rotation_song(catalog, tag_weights=None, skip_years=()):
+    """Draw from the first year in the rotation that has a postable song.
+
+    Years in `skip_years` (claimed by queued posts) and years whose songs
+    were all posted recently are passed over but stay in the rotation. A
+    year is only marked covered when the catalog has no songs from it that
+    are eligible or still unresolved.
+    """
+    if not catalog.bucket_size(ALL_SONGS):
         return None
-    except (KeyError, TypeError) as e:
-        print(f"Error parsing random song API response: {e}")
+    rotation = get_year_rotation()
+    skipped = []
+    for year in list(rotation.remaining):
+        if year in skip_years:
+            continue
+        if catalog.bucket_size(year_bucket(year)):
+            song = draw_catalog_song(catalog, tag_weights, year=year)
+            if song:
+                if skipped:
+                    print(f"⏭️ Skipped {len(skipped)} years with no postable songs right now.")
+                return dict(song, rotation_year=year)
+            skipped.append(year)
+        elif catalog.unresolved_count(year):
+            skipped.append(year)
+        else:
+            print(f"⏭️ The catalog has no songs with cover art from {year}; marking it covered.")
+            rotation.mark_covered(year)
+    return None
+
+def record_posted(song, rotate_years=False):
+    get_posted_ledger().record(song)
+    # Only songs drawn for a rotation year cover it, not API fallbacks.
+    if rotate_years and song.get("rotation_year") is not None:
+        get_year_rotation().mark_covered(song["rotation_year"])
+
+def get_random_song(candidates=CANDIDATE_COUNT, use_catalog=False, tag_weights=None, rotate_years=False,
+                    skip_years=()):
+    """Fetch random songs from PopHits API; only return one if cover art is available.
+
+    With `use_catalog`, draw from the local catalog's eligible songs instead and
+    only fall back to the API if the catalog has nothing to offer. With
+    `rotate_years` as well, the draw is limited to the next year in
+    remaining_years.json that isn't in `skip_years`.
+    """
+    if use_catalog:
+        catalog = get_catalog()
+        if rotate_years:
+            song = draw_rotation_song(catalog, tag_weights, skip_years)
+        else:
+            song = draw_catalog_song(catalog, tag_weights)
+        if song:
+            return song
+        print("⚠️ Local catalog has no eligible songs; falling back to the random song API.")
+
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=candidates)
+    try:
+        return asyncio.run(find_song_with_cover_art(candidates, executor))
+    finally:
+        # Don't block on lookups for candidates we no longer need.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def encode_cover_art(song):
+    return prepare_cover_art(song['cover_art_url'], mbid=song.get('mbid'), cache=get_image_cache())
+
+def upload_cover_art(client, prepared, image_bytes=None):
+    try:
+        if image_bytes is None:
+            image_bytes = encode_cover_art(prepared['song'])
+        with metrics.stage('bluesky_upload_blob'):
+            blob = client.upload_blob(image_bytes).blob
+    except Exception as e:
+        prepared.update(get_outbox().record_failure(prepared['id'], e))
+        raise
+    metrics.add_bytes('bluesky', 'out', len(image_bytes))
+    prepared.update(get_outbox().mark_blob_uploaded(prepared['id'], blob.model_dump(mode='json', by_alias=True)))
+
+def prepare_bluesky_post(client, song, post_text, image_bytes=None, account=DEFAULT_ACCOUNT):
+    """Do all the work for a post up front: facets, image processing and blob upload.
+
+    The post is recorded in the outbox first, so it can be resumed if
+    anything after this point fails.
+    """
+    with metrics.stage('build_facets'):
+        facets = build_facets(post_text)
+    prepared = dict(get_outbox().add(account, song, post_text), facets=facets)
+    upload_cover_art(client, prepared, image_bytes)
+    return prepared
+
+def publish_prepared_post(client, prepared):
+    """Create the post under the outbox entry's record key; returns the post URI."""
+    from atproto import models as atproto_models
+    from atproto_client.models.blob_ref import BlobRef
+
+    record = atproto_models.AppBskyFeedPost.Record(
+        text=prepared['text'],
+        embed=atproto_models.AppBskyEmbedImages.Main(
+            images=[
+                atproto_models.AppBskyEmbedImages.Image(
+                    alt="Cover Art",
+                    image=BlobRef.model_validate(prepared['blob']),
+                ),
+            ],
+        ),
+        facets=prepared.get('facets') or build_facets(prepared['text']),
+        created_at=client.get_current_time_iso(),
+    )
+    try:
+        with metrics.stage('bluesky_post'):
+            response = client.app.bsky.feed.post.create(client.me.did, record, rkey=prepared['rkey'])
+    except Exception as e:
+        prepared.update(get_outbox().record_failure(prepared['id'], e))
+        raise
+    prepared.update(get_outbox().mark_posted(prepared['id'], response.uri))
+    return response.uri
+
+def get_existing_post(client, rkey):
+    from atproto.exceptions import BadRequestError
+
+    try:
+        return client.app.bsky.feed.post.get(client.me.did, rkey)
+    except BadRequestError:
         return None
 
+def finish_post(client, prepared, image_bytes=None):
+    """Run whichever steps an outbox entry is still missing and publish it; returns the post URI.
+
+    Once the blob is uploaded the record key is looked up first, since an
+    earlier run may have created the post and crashed before recording it.
+    A blob older than BLOB_MAX_AGE is uploaded again.
+    """
+    if prepared['state'] == BLOB_UPLOADED:
+        existing = get_existing_post(client, prepared['rkey'])
+        if existing:
+            prepared.update(get_outbox().mark_posted(prepared['id'], existing.uri))
+            return existing.uri
+    if prepared['state'] == PREPARED or time.time() - prepared['blob_uploaded_at'] > BLOB_MAX_AGE:
+        upload_cover_art(client, prepared, image_bytes)
+    return publish_prepared_post(client, prepared)
+
+def resume_outbox(client, pending, rotate_years=False):
+    """Finish posts left over from an earlier run; returns True if any of them got posted."""
+    posted = False
+    for prepared in pending:
+        song = prepared['song']
+        print(f"🔁 Resuming unfinished post of '{song['title']}' by {song['artist']} ({prepared['state']})")
+        try:
+            uri = finish_post(client, prepared)
+        except Exception as e:
+            print(f"🚫 Error: Failed to resume post: {e}")
+            continue
+        record_posted(song, rotate_years)
+        print(f"✅ Posted {uri}")
+        posted = True
+    return posted
+
 def create_bluesky_post(username, password, song, post_text, url, client=None, dry_run=False):
     try:
         print("--- DRY RUN OUTPUT ---" if dry_run else "", end="")
@@ -213,74 +529,248 @@ def create_bluesky_post(username, password, song, post_text, url, client=None, d
             print("\n(DRY RUN: No post will be made)\n")
             return
 
-        # Facet generation:
-        facets = []
-        
-        # Find the FULL URL in the post text, not just the domain
-        full_url = f"https://pophits.org/songs/{song['slug']}"
-        url_start = post_text.find(full_url)
-        
-        if url_start != -1:
-            url_end = url_start + len(full_url)
-            byte_start = len(post_text[:url_start].encode('utf-8'))
-            byte_end = len(post_text[:url_end].encode('utf-8'))
-            facets.append(
-                atproto_models.AppBskyRichtextFacet.Main(
-                    features=[atproto_models.AppBskyRichtextFacet.Link(uri=full_url)],
-                    index=atproto_models.AppBskyRichtextFacet.ByteSlice(byteStart=byte_start, byteEnd=byte_end),
-                )
-            )
-
-        # Hashtag facets
-        for match in re.finditer(r"#\w+", post_text):
-            hashtag = match.group(0)
-            hashtag_start = match.start()
-            hashtag_end = match.end()
-            hashtag_byte_start = len(post_text[:hashtag_start].encode('utf-8'))
-            hashtag_byte_end = len(post_text[:hashtag_end].encode('utf-8'))
-            facets.append(
-                atproto_models.AppBskyRichtextFacet.Main(
-                    features=[atproto_models.AppBskyRichtextFacet.Link(uri=f"https://bsky.app/search?q={hashtag[1:]}")],
-                    index=atproto_models.AppBskyRichtextFacet.ByteSlice(
-                        byteStart=hashtag_byte_start, byteEnd=hashtag_byte_end
-                    ),
-                )
-            )
-
-        # Rest of your code remains the same...
-        if song.get('cover_art_url'):
-            image_url = song['cover_art_url']
-            image_response = requests.get(image_url, stream=True)
-            image_response.raise_for_status()
-            image = Image.open(io.BytesIO(image_response.content))
-            image_bytes = io.BytesIO()
-            image.save(image_bytes, format='JPEG')
-            image_bytes.seek(0)
-            upload = client.upload_blob(image_bytes.read())
-            client.post(
-                text=post_text,
-                embed=atproto_models.AppBskyEmbedImages.Main(
-                    images=[
-                        atproto_models.AppBskyEmbedImages.Image(
-                            alt="Cover Art",
-                            image=upload.blob,
-                        ),
-                    ],
-                ),
-                facets=facets,
-            )
-        else:
+        if not song.get('cover_art_url'):
             print("⚠️ Warning: Attempted to post without cover art - this shouldn't happen!")
             return
 
+        publish_prepared_post(client, prepare_bluesky_post(client, song, post_text))
         print("✅ Bluesky post created successfully!")
+        return True
     except Exception as e:
         print(f"🚫 Error: Failed to create Bluesky post: {e}")
+        return False
+
+def export_metrics():
+    try:
+        export(METRICS_JSONL, METRICS_TEXTFILE, METRICS_HISTOGRAMS)
+    except OSError as e:
+        print(f"⚠️ Could not write metrics: {e}")
+
+def get_bluesky_client(username, password, session_path=None):
+    import bluesky_session
+
+    with metrics.stage('bluesky_login'):
+        return bluesky_session.login(username, password, session_path or os.path.join(STATE_DIR, 'bluesky_session'))
+
+def run_scheduler(client, args):
+    """Log in once and publish a post every `args.interval` seconds from a prefilled queue.
+
+    Unfinished posts in the outbox, from a previous process or a failed
+    publish, are queued before any new song is drawn.
+    """
+    def prepare_next(queued_songs):
+        queued_slugs = {song['slug'] for song in queued_songs}
+        # Each queued post claims its rotation year until it is published.
+        queued_years = {song.get('rotation_year') for song in queued_songs}
+        for prepared in get_outbox().pending(DEFAULT_ACCOUNT):
+            if prepared['slug'] in queued_slugs:
+                continue
+            try:
+                if prepared['state'] == PREPARED:
+                    upload_cover_art(client, prepared)
+                return dict(prepared, resumed=True)
+            except Exception as e:
+                print(f"🚫 Error: Failed to resume post of '{prepared['song']['title']}': {e}")
+                queued_years.add(prepared['song'].get('rotation_year'))
+        for _ in range(CATALOG_DRAW_ATTEMPTS):
+            song = get_random_song(max(1, args.candidates), use_catalog=args.catalog,
+                                   tag_weights=parse_tag_weights(args.tag_weight),
+                                   rotate_years=args.rotate_years, skip_years=queued_years)
+            if not song:
+                return None
+            if song['slug'] in queued_slugs:
+                continue
+            try:
+                return prepare_bluesky_post(client, song, generate_post(song, selector=get_template_selector()))
+            except Exception as e:
+                print(f"🚫 Error: Failed to prepare post for '{song['title']}': {e}")
+        return None
+
+    def refresh_blob(prepared):
+        try:
+            upload_cover_art(client, prepared)
+            return True
+        except Exception as e:
+            print(f"🚫 Error: Failed to re-upload cover art: {e}")
+            return False
+
+    def publish(prepared):
+        try:
+            # Posts prepared by this process can't already exist; resumed ones are looked up first.
+            if prepared.get('resumed') or prepared['attempts']:
+                finish_post(client, prepared)
+            else:
+                publish_prepared_post(client, prepared)
+        except Exception as e:
+            print(f"🚫 Error: Failed to create Bluesky post: {e}")
+            metrics.set_outcome('post_failed')
+            export_metrics()
+            metrics.reset()
+            return False
+        record_posted(prepared['song'], args.rotate_years)
+        metrics.set_outcome('posted')
+        export_metrics()
+        metrics.reset()
+        print(f"✅ Posted '{prepared['song']['title']}' by {prepared['song']['artist']}")
+        return True
+
+    scheduler = PostScheduler(prepare_next, refresh_blob, publish, args.interval, queue_size=args.queue_size)
+    scheduler.run(max_posts=args.max_posts)
+
+def select_fan_out_song(feeds, args):
+    """Draw a song that at least one feed takes; returns (song, feeds that take it)."""
+    tag_weights = parse_tag_weights(args.tag_weight) or feed_tag_weights(feeds)
+    for _ in range(CATALOG_DRAW_ATTEMPTS):
+        song = get_random_song(max(1, args.candidates), use_catalog=args.catalog,
+                               tag_weights=tag_weights, rotate_years=args.rotate_years)
+        if not song:
+            return None, []
+        song_tags = tag_song(song)
+        matching = [feed for feed in feeds if feed.accepts(song_tags)]
+        if matching:
+            return song, matching
+        print(f"⏭️ No feed takes '{song['title']}' by {song['artist']}; drawing again.")
+    return None, []
+
+def fan_out(args):
+    """Post one song to every feed that takes it; returns the run outcome for metrics.
+
+    The song, its cover art lookup and the image encoding are shared by all
+    feeds. Each feed then logs in with its own session, uploads the image to
+    its own account and posts its own text, all feeds at once. If any feed
+    has unfinished posts in the outbox, the run only finishes those.
+    """
+    try:
+        feeds = load_feeds(args.feeds)
+    except (OSError, ValueError) as e:
+        print(f"🚫 Error: Could not load feeds from {args.feeds}: {e}")
+        return 'no_feeds'
+
+    def feed_client(feed):
+        username, password = feed.credentials()
+        if not username or not password:
+            print(f"🚫 [{feed.name}] Error: {feed.env_prefix}_BLUESKY_USERNAME and "
+                  f"{feed.env_prefix}_BLUESKY_PASSWORD must be set.")
+            return None
+        return get_bluesky_client(username, password, feed.session_path(STATE_DIR))
+
+    pending = {feed.name: get_outbox().pending(feed.name) for feed in feeds} if not args.dry_run else {}
+    if any(pending.values()):
+        def resume(feed):
+            client = feed_client(feed)
+            return client is not None and resume_outbox(client, pending[feed.name], args.rotate_years)
+
+        results = publish_all([feed for feed in feeds if pending[feed.name]], resume)
+        return 'posted' if any(results.values()) else 'post_failed'
+
+    with metrics.stage('select_song'):
+        song, matching = select_fan_out_song(feeds, args)
+    if not song:
+        print("🚫 No song with cover art found for any feed. No post will be made.")
+        return 'no_song'
+    print(f"🎵 '{song['title']}' by {song['artist']} goes to: {', '.join(feed.name for feed in matching)}")
+
+    image_bytes = None
+    if not args.dry_run:
+        import requests
+
+        try:
+            image_bytes = encode_cover_art(song)
+        except (CoverArtError, requests.exceptions.RequestException) as e:
+            print(f"🚫 Error: Failed to prepare cover art for '{song['title']}': {e}")
+            return 'post_failed'
+
+    def publish(feed):
+        post_text = generate_post(song, pools=feed.pools, fallback_pool=feed.fallback_pool,
+                                  selector=get_template_selector(), record_usage=not args.dry_run)
+        if args.dry_run:
+            print(f"--- DRY RUN OUTPUT [{feed.name}] ---\n{post_text}\n")
+            return True
+        client = feed_client(feed)
+        if client is None:
+            return False
+        publish_prepared_post(client, prepare_bluesky_post(client, song, post_text, image_bytes, feed.name))
+        print(f"✅ [{feed.name}] Bluesky post created successfully!")
+        return True
+
+    results = publish_all(matching, publish)
+    if args.dry_run:
+        return 'dry_run'
+    if not any(results.values()):
+        return 'post_failed'
+    record_posted(song, args.rotate_years)
+    return 'posted' if all(results.values()) else 'partially_posted'
+
+def print_template_stats(as_json=False, top=3):
+    """Print how often each tag and template has been used, to show which pools need more variety."""
+    stats = get_template_selector().stats({**TAG_POOLS, FALLBACK_TAG: FALLBACK_POOL})
+    if as_json:
+        import json
+
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+        return
+    print(f"📊 {stats['posts']} posts generated")
+    for tag in sorted(stats['tags'], key=lambda t: -t['uses']):
+        print(f"\n{tag['tag']}: {tag['uses']} uses ({tag['share']:.0%}), "
+              f"{tag['never_used']}/{tag['pool_size']} templates never used")
+        used = [t for t in tag['templates'] if t['uses']]
+        for label, rows in (('most used', used[:top]), ('least used', used[max(top, len(used) - top):][::-1])):
+            for row in rows:
+                print(f"  {label}: {row['uses']}x {row['template']}")
 
 def main():
     parser = argparse.ArgumentParser(description='Post a random song from pophits.org to Bluesky.')
     parser.add_argument('--dry-run', action='store_true', help='Only print the post, do not publish it.')
+    parser.add_argument('--candidates', type=int, default=CANDIDATE_COUNT,
+                        help='Number of random songs to look up concurrently per run.')
+    parser.add_argument('--catalog', action='store_true',
+                        help='Draw the song from the local catalog (see sync-catalog) instead of the API.')
+    parser.add_argument('--rotate-years', action='store_true',
+                        help='With --catalog, post from one year at a time, rotating through remaining_years.json.')
+    parser.add_argument('--tag-weight', action='append', metavar='TAG=WEIGHT',
+                        help='With --catalog, weight the draw towards a tag from tag_song. Can be repeated.')
+    subparsers = parser.add_subparsers(dest='command')
+    sync_parser = subparsers.add_parser('sync-catalog', help='Sync the PopHits song list into the local catalog.')
+    sync_parser.add_argument('--resolve', action='store_true',
+                             help='Look up cover art for songs not yet in the lookup cache (slow).')
+    schedule_parser = subparsers.add_parser('schedule', help='Keep running and post on a fixed cadence.')
+    schedule_parser.add_argument('--interval', type=float, default=SCHEDULE_INTERVAL,
+                                 help='Seconds between posts.')
+    schedule_parser.add_argument('--queue-size', type=int, default=3,
+                                 help='Number of posts to keep prepared ahead of time.')
+    schedule_parser.add_argument('--max-posts', type=int, default=None,
+                                 help='Stop after this many posts (default: run forever).')
+    warm_parser = subparsers.add_parser('warm-cache',
+                                        help='Resolve MusicBrainz IDs and cover art for the whole catalog.')
+    warm_parser.add_argument('--workers', type=int, default=WARM_CACHE_WORKERS,
+                             help='Concurrent lookups (rate limits still apply per host).')
+    warm_parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint from an interrupted run.')
+    warm_parser.add_argument('--no-sync', action='store_true', help='Skip syncing the song list first.')
+    fan_out_parser = subparsers.add_parser('fan-out', help='Post one song to every feed in a feeds file that takes it.')
+    fan_out_parser.add_argument('--feeds', default=FEEDS_FILE, help='Path to the feeds JSON file.')
+    stats_parser = subparsers.add_parser('template-stats', help='Show how often each tag and template has been used.')
+    stats_parser.add_argument('--json', action='store_true', help='Print the full per-template counts as JSON.')
+    stats_parser.add_argument('--top', type=int, default=3, help='Most and least used templates to list per tag.')
     args = parser.parse_args()
+    if args.rotate_years and not args.catalog:
+        # Without the catalog the draw can't be limited to a year, so marking years covered would be wrong.
+        parser.error('--rotate-years requires --catalog')
+
+    if args.command == 'sync-catalog':
+        sync_catalog(resolve=args.resolve)
+        return
+    if args.command == 'warm-cache':
+        warm_cache(workers=args.workers, restart=args.restart, sync=not args.no_sync)
+        return
+    if args.command == 'template-stats':
+        print_template_stats(as_json=args.json, top=args.top)
+        return
+    if args.command == 'fan-out':
+        try:
+            metrics.set_outcome(fan_out(args))
+        finally:
+            export_metrics()
+        return
 
     username = POPHITS_BLUESKY_USERNAME
     password = POPHITS_BLUESKY_PASSWORD
@@ -289,18 +779,45 @@ def main():
         print(f"Error: Bluesky username and password for pophits account must be set in environment variables.")
         return
 
-    song = get_random_song()
-    if song:
-        post_text = generate_post(song)
-        url = f"https://pophits.org/songs/{song['slug']}"
-        if args.dry_run:
-            create_bluesky_post(username, password, song, post_text, url, dry_run=True)
-        else:
-            client = Client()
-            client.login(username, password)
-            create_bluesky_post(username, password, song, post_text, url, client, dry_run=False)
-    else:
+    if args.command == 'schedule':
+        run_scheduler(get_bluesky_client(username, password), args)
+        return
+
+    try:
+        metrics.set_outcome(post_once(args, username, password))
+    finally:
+        export_metrics()
+
+def post_once(args, username, password):
+    """Select, prepare and publish a single post; returns the run outcome for metrics.
+
+    If an earlier run left a post unfinished in the outbox, this run finishes
+    it instead of starting a new one.
+    """
+    pending = [] if args.dry_run else get_outbox().pending(DEFAULT_ACCOUNT)
+    if pending:
+        client = get_bluesky_client(username, password)
+        return 'posted' if resume_outbox(client, pending, args.rotate_years) else 'post_failed'
+
+    with metrics.stage('select_song'):
+        song = get_random_song(max(1, args.candidates), use_catalog=args.catalog,
+                               tag_weights=parse_tag_weights(args.tag_weight),
+                               rotate_years=args.rotate_years)
+    if not song:
         print("🚫 No song with cover art found. No post will be made.")
+        return 'no_song'
+
+    post_text = generate_post(song, selector=get_template_selector(), record_usage=not args.dry_run)
+    url = f"https://pophits.org/songs/{song['slug']}"
+    if args.dry_run:
+        create_bluesky_post(username, password, song, post_text, url, dry_run=True)
+        return 'dry_run'
+
+    client = get_bluesky_client(username, password)
+    if create_bluesky_post(username, password, song, post_text, url, client, dry_run=False):
+        record_posted(song, args.rotate_years)
+        return 'posted'
+    return 'post_failed'
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,137 @@
+import random
+from array import array
+from datetime import datetime
+
+from post_text import DECADE_TAGS, LONGEVITY_WEEKS, SHORT_RUN_WEEKS, TIMELESS_AGE, compose_post, generate_hashtags
+
+# Same order as tag_song, so per-row tag lists come out identical.
+TAG_ORDER = ('number_one', 'top_ten', 'longevity', 'short_run', 'timeless') + tuple(t for t, _, _ in DECADE_TAGS)
+
+
+class SongTable:
+    """Column-oriented song data: one list/array per field instead of one dict per song."""
+
+    def __init__(self, titles, artists, slugs, years, peak_ranks, weeks_on_chart):
+        self.titles = list(titles)
+        self.artists = list(artists)
+        self.slugs = list(slugs)
+        self.years = array('i', years)
+        self.peak_ranks = array('i', peak_ranks)
+        self.weeks_on_chart = array('i', weeks_on_chart)
+        lengths = {len(column) for column in (self.titles, self.artists, self.slugs,
+                                               self.years, self.peak_ranks, self.weeks_on_chart)}
+        if len(lengths) > 1:
+            raise ValueError("All SongTable columns must have the same length")
+
+    @classmethod
+    def from_songs(cls, songs):
+        songs = list(songs)
+        return cls(
+            [s['title'] for s in songs],
+            [s['artist'] for s in songs],
+            [s['slug'] for s in songs],
+            [s['year'] for s in songs],
+            [s['peak_rank'] for s in songs],
+            [s['weeks_on_chart'] for s in songs],
+        )
+
+    def __len__(self):
+        return len(self.slugs)
+
+    def row(self, i):
+        return {
+            'title': self.titles[i],
+            'artist': self.artists[i],
+            'slug': self.slugs[i],
+            'year': self.years[i],
+            'peak_rank': self.peak_ranks[i],
+            'weeks_on_chart': self.weeks_on_chart[i],
+        }
+
+
+def value_tags(current_year=None):
+    """tag_song split by column: functions from a peak, weeks or year value to its tags, in tag_song order."""
+    if current_year is None:
+        current_year = datetime.now().year
+    timeless_cutoff = current_year - TIMELESS_AGE
+
+    def peak_tags(peak):
+        return ('number_one',) if peak == 1 else ('top_ten',) if peak <= 10 else ()
+
+    def weeks_tags(weeks):
+        return (('longevity',) if weeks >= LONGEVITY_WEEKS else ()) + (('short_run',) if weeks < SHORT_RUN_WEEKS else ())
+
+    def year_tags(year):
+        decade = next(((tag,) for tag, start, end in DECADE_TAGS if start <= year < end), ())
+        return (('timeless',) if year <= timeless_cutoff else ()) + decade
+
+    return peak_tags, weeks_tags, year_tags
+
+
+def tag_groups(table, current_year=None):
+    """Group row indices by their tag_song tags: {tags tuple: [row indices]}.
+
+    Tags are worked out once per distinct peak, weeks and year value rather
+    than once per row, so each row costs only the dict lookups for its group.
+    """
+    peak_tags, weeks_tags, year_tags = value_tags(current_year)
+    peak_lookup = {peak: peak_tags(peak) for peak in set(table.peak_ranks)}
+    weeks_lookup = {weeks: weeks_tags(weeks) for weeks in set(table.weeks_on_chart)}
+    year_lookup = {year: year_tags(year) for year in set(table.years)}
+    by_parts = {}
+    for i, parts in enumerate(zip(map(peak_lookup.__getitem__, table.peak_ranks),
+                                  map(weeks_lookup.__getitem__, table.weeks_on_chart),
+                                  map(year_lookup.__getitem__, table.years))):
+        rows = by_parts.get(parts)
+        if rows is None:
+            rows = by_parts[parts] = []
+        rows.append(i)
+    return {sum(parts, ()): rows for parts, rows in by_parts.items()}
+
+
+def row_tags(table, groups):
+    """Turn tag groups back into per-song tag lists."""
+    tags = [None] * len(table)
+    for group_tags, rows in groups.items():
+        for i in rows:
+            tags[i] = list(group_tags)
+    return tags
+
+
+def tag_counts(groups):
+    counts = {tag: 0 for tag in TAG_ORDER}
+    for group_tags, rows in groups.items():
+        for tag in group_tags:
+            counts[tag] += len(rows)
+    return counts
+
+
+def generate_posts(table, current_year=None, rng=random):
+    """Generate post text for every song in `table` in one call.
+
+    Strings that depend on a single column are built once per distinct value:
+    number fields, and hashtags per artist. Rows with the same tags, budget and
+    field lengths share one fitting-template lookup, so per row only the tag
+    shuffle, the template pick and the render are left.
+    """
+    groups = tag_groups(table, current_year)
+    hashtags = {artist: generate_hashtags({'artist': artist}) for artist in set(table.artists)}
+    numbers = {n: str(n) for column in (table.years, table.peak_ranks, table.weeks_on_chart) for n in set(column)}
+    fitting_cache = {}
+    posts = [None] * len(table)
+    for group_tags, rows in groups.items():
+        for i in rows:
+            tags = list(group_tags)
+            rng.shuffle(tags)
+            artist = table.artists[i]
+            values = {
+                'title': table.titles[i],
+                'artist': artist,
+                'year': numbers[table.years[i]],
+                'peak_rank': numbers[table.peak_ranks[i]],
+                'weeks_on_chart': numbers[table.weeks_on_chart[i]],
+                'emoji': '',
+            }
+            _, _, posts[i] = compose_post(values, table.slugs[i], hashtags[artist], tags, rng,
+                                          fitting_cache=fitting_cache)
+    return posts
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class CacheWarmer:
+    """Runs `work(item)` over many items on a bounded worker pool, resumably.
+
+    Keys of finished items are checkpointed to a JSON file every
+    `checkpoint_every` completions and on interruption, so a rerun skips
+    them. `work` returns True when an item is finished for good, or False
+    when it should be retried on the next run (e.g. after a network error).
+    Rate limits are left to the shared HTTP client, so extra workers only
+    overlap waiting, they never exceed a host's limit.
+    """
+
+    def __init__(self, checkpoint_path, workers=4, checkpoint_every=50, on_checkpoint=None):
+        self.checkpoint_path = checkpoint_path
+        self.workers = max(1, workers)
+        self.checkpoint_every = checkpoint_every
+        self.on_checkpoint = on_checkpoint
+        self.done = set()
+
+    def load(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                self.done = set(json.load(f).get('done', []))
+        except FileNotFoundError:
+            self.done = set()
+        return self.done
+
+    def save(self):
+        if self.on_checkpoint:
+            self.on_checkpoint()
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'saved_at': time.time(), 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def reset(self):
+        self.done = set()
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def run(self, items, key, work):
+        """Process every item whose key is not checkpointed; returns (finished, retry_later, interrupted)."""
+        self.load()
+        finished = retry_later = since_checkpoint = 0
+        in_flight = {}
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        def collect(futures):
+            nonlocal finished, retry_later, since_checkpoint
+            for future in futures:
+                item_key = in_flight.pop(future)
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"Error warming {item_key}: {e}")
+                    ok = False
+                if ok:
+                    self.done.add(item_key)
+                    finished += 1
+                    since_checkpoint += 1
+                else:
+                    retry_later += 1
+            if since_checkpoint >= self.checkpoint_every:
+                self.save()
+                since_checkpoint = 0
+                print(f"Warmed {finished} songs so far ({retry_later} to retry later)...")
+
+        try:
+            for item in items:
+                item_key = key(item)
+                if item_key in self.done:
+                    continue
+                # Keep the queue short so an interruption loses little work.
+                while len(in_flight) >= self.workers * 2:
+                    completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(completed)
+                in_flight[pool.submit(work, item)] = item_key
+            while in_flight:
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(completed)
+        except KeyboardInterrupt:
+            print("Interrupted; saving checkpoint...")
+            for future in in_flight:
+                future.cancel()
+            pool.shutdown(wait=True, cancel_futures=True)
+            collect([f for f in list(in_flight) if f.done() and not f.cancelled()])
+            self.save()
+            return finished, retry_later, True
+        pool.shutdown(wait=True)
+        self.save()
+        return finished, retry_later, False
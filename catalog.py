@@ -0,0 +1,187 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+ALL_SONGS = ''
+
+SONG_COLUMNS = (
+    'slug', 'title', 'artist', 'year', 'peak_rank', 'weeks_on_chart', 'tags', 'mbid', 'eligible'
+)
+
+
+def tag_bucket(tag):
+    return f"tag:{tag}"
+
+
+def year_bucket(year):
+    return f"year:{year}"
+
+
+class SongCatalog:
+    """Local SQLite index of PopHits songs with precomputed cover art eligibility.
+
+    Eligible songs are laid out in `draw_index` as dense 0..n-1 positions per
+    bucket (all songs, one bucket per tag and one per year), so a random draw
+    is a single primary key lookup regardless of catalog size. Call
+    `rebuild_draw_index` after changing songs or eligibility.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS songs (
+                slug TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                peak_rank INTEGER NOT NULL,
+                weeks_on_chart INTEGER NOT NULL,
+                tags TEXT NOT NULL,
+                mbid TEXT,
+                eligible INTEGER,
+                synced_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS song_tags (
+                tag TEXT NOT NULL,
+                slug TEXT NOT NULL,
+                PRIMARY KEY (tag, slug)
+            );
+            CREATE TABLE IF NOT EXISTS draw_index (
+                bucket TEXT NOT NULL,
+                pos INTEGER NOT NULL,
+                slug TEXT NOT NULL,
+                PRIMARY KEY (bucket, pos)
+            );
+            CREATE TABLE IF NOT EXISTS bucket_sizes (
+                bucket TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS songs_eligible ON songs (eligible);
+        """)
+        self._conn.commit()
+
+    def upsert_song(self, song, tags):
+        """Insert or update a song's metadata, keeping any eligibility already resolved."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO songs (slug, title, artist, year, peak_rank, weeks_on_chart, tags, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (slug) DO UPDATE SET
+                    title = excluded.title,
+                    artist = excluded.artist,
+                    year = excluded.year,
+                    peak_rank = excluded.peak_rank,
+                    weeks_on_chart = excluded.weeks_on_chart,
+                    tags = excluded.tags,
+                    synced_at = excluded.synced_at
+                """,
+                (song['slug'], song['title'], song['artist'], song['year'], song['peak_rank'],
+                 song['weeks_on_chart'], ' '.join(tags), time.time()),
+            )
+            self._conn.execute("DELETE FROM song_tags WHERE slug = ?", (song['slug'],))
+            self._conn.executemany(
+                "INSERT INTO song_tags (tag, slug) VALUES (?, ?)", [(tag, song['slug']) for tag in tags]
+            )
+
+    def set_eligibility(self, slug, mbid, has_cover_art):
+        # Only the flag is stored; the cover art URL is built from the MBID when a song is drawn.
+        with self._lock:
+            self._conn.execute(
+                "UPDATE songs SET mbid = ?, eligible = ? WHERE slug = ?",
+                (mbid, 1 if has_cover_art else 0, slug),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rebuild_draw_index(self):
+        with self._lock:
+            conn = self._conn
+            conn.execute("DELETE FROM draw_index")
+            conn.execute("DELETE FROM bucket_sizes")
+            rows = conn.execute("SELECT slug, year FROM songs WHERE eligible = 1 ORDER BY slug").fetchall()
+            eligible = [slug for slug, _ in rows]
+            buckets = {ALL_SONGS: eligible}
+            for slug, year in rows:
+                buckets.setdefault(year_bucket(year), []).append(slug)
+            for tag, slug in conn.execute(
+                "SELECT t.tag, t.slug FROM song_tags t JOIN songs s ON s.slug = t.slug "
+                "WHERE s.eligible = 1 ORDER BY t.tag, t.slug"
+            ):
+                buckets.setdefault(tag_bucket(tag), []).append(slug)
+            for bucket, slugs in buckets.items():
+                conn.executemany(
+                    "INSERT INTO draw_index (bucket, pos, slug) VALUES (?, ?, ?)",
+                    [(bucket, pos, slug) for pos, slug in enumerate(slugs)],
+                )
+                conn.execute("INSERT INTO bucket_sizes (bucket, size) VALUES (?, ?)", (bucket, len(slugs)))
+            conn.commit()
+            return len(eligible)
+
+    def bucket_size(self, bucket):
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM bucket_sizes WHERE bucket = ?", (bucket,)).fetchone()
+        return row[0] if row else 0
+
+    def unresolved_count(self, year=None):
+        """Number of songs (from `year`, if given) whose cover art hasn't been looked up yet."""
+        query = "SELECT COUNT(*) FROM songs WHERE eligible IS NULL"
+        params = ()
+        if year is not None:
+            query += " AND year = ?"
+            params = (year,)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def draw(self, tag_weights=None, year=None):
+        """Draw a random eligible song.
+
+        With `year`, only songs from that year are drawn. Otherwise a tag
+        bucket is optionally picked by `tag_weights` first.
+        """
+        bucket = ALL_SONGS
+        if year is not None:
+            bucket = year_bucket(year)
+        elif tag_weights:
+            weighted = [(tag_bucket(tag), weight) for tag, weight in tag_weights.items()
+                        if weight > 0 and self.bucket_size(tag_bucket(tag)) > 0]
+            if weighted:
+                bucket = random.choices([b for b, _ in weighted], weights=[w for _, w in weighted])[0]
+        size = self.bucket_size(bucket)
+        if size == 0:
+            return None
+        pos = random.randrange(size)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join('s.' + c for c in SONG_COLUMNS)} FROM draw_index d "
+                "JOIN songs s ON s.slug = d.slug WHERE d.bucket = ? AND d.pos = ?",
+                (bucket, pos),
+            ).fetchone()
+        return self._row_to_song(row) if row else None
+
+    def songs(self, only_unresolved=False):
+        query = f"SELECT {', '.join(SONG_COLUMNS)} FROM songs"
+        if only_unresolved:
+            query += " WHERE eligible IS NULL"
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY slug").fetchall()
+        return [self._row_to_song(row) for row in rows]
+
+    @staticmethod
+    def _row_to_song(row):
+        song = dict(row)
+        song['tags'] = song['tags'].split()
+        return song
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
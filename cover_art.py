@@ -0,0 +1,153 @@
+import hashlib
+import io
+import os
+import tempfile
+from urllib.parse import urlsplit
+
+import http_client
+from metrics import metrics
+
+BLUESKY_MAX_BLOB_BYTES = 1_000_000  # app.bsky.embed.images image size limit
+MAX_DOWNLOAD_BYTES = 15 * 1024 * 1024
+TARGET_DIMENSION = 1200
+JPEG_QUALITIES = (88, 80, 72, 64, 56, 48)
+MIN_DIMENSION = 300
+CHUNK_SIZE = 64 * 1024
+
+
+class CoverArtError(Exception):
+    pass
+
+
+def download_image(url, max_bytes=MAX_DOWNLOAD_BYTES):
+    """Stream an image into memory, giving up as soon as it grows past `max_bytes`."""
+    response = http_client.get(url, stream=True)
+    try:
+        response.raise_for_status()
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise CoverArtError(f"Cover art is {int(declared)} bytes, over the {max_bytes} byte cap")
+        data = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            data.extend(chunk)
+            if len(data) > max_bytes:
+                raise CoverArtError(f"Cover art exceeded the {max_bytes} byte cap while downloading")
+        metrics.add_bytes(urlsplit(response.url or url).hostname or '', 'in', len(data))
+        return bytes(data)
+    finally:
+        response.close()
+
+
+def to_rgb(image):
+    """Flatten any PIL mode (RGBA, LA, P with transparency, CMYK, ...) onto a white RGB canvas."""
+    from PIL import Image
+
+    if image.mode == 'RGB':
+        return image
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode_for_upload(image_data, max_dimension=TARGET_DIMENSION, max_bytes=BLUESKY_MAX_BLOB_BYTES):
+    """Downscale and re-encode raw image bytes as a JPEG that fits under `max_bytes`.
+
+    JPEG sources are decoded at reduced scale via `Image.draft`, so a large
+    original never has to be decoded at full resolution.
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft('RGB', (max_dimension, max_dimension))
+        # Decode here rather than lazily in thumbnail(), so truncated or
+        # corrupt data is reported as CoverArtError.
+        image.load()
+        image = to_rgb(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise CoverArtError(f"Could not decode cover art: {e}")
+
+    dimension = max_dimension
+    while dimension >= MIN_DIMENSION:
+        image.thumbnail((dimension, dimension), Image.LANCZOS)
+        for quality in JPEG_QUALITIES:
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True, progressive=True)
+            if output.tell() <= max_bytes:
+                return output.getvalue()
+        dimension = int(dimension * 0.75)
+    raise CoverArtError(f"Could not encode cover art under {max_bytes} bytes")
+
+
+def atomic_write(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ImageCache:
+    """Content-addressed disk cache of upload-ready JPEGs.
+
+    Image bytes live in `objects/<sha256>.jpg`; `refs/<key>` holds the digest
+    for a cache key (MBID plus processing size), so identical art shared by
+    several releases is stored once.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _ref_path(self, key):
+        safe_key = ''.join(c if c.isalnum() or c in '-_' else '_' for c in key)
+        return os.path.join(self.directory, 'refs', safe_key)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', f"{digest}.jpg")
+
+    def get(self, key):
+        try:
+            with open(self._ref_path(key)) as f:
+                digest = f.read().strip()
+            with open(self._object_path(digest), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            return None
+        return data
+
+    def put(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            atomic_write(object_path, data)
+        atomic_write(self._ref_path(key), digest.encode())
+        return digest
+
+
+def prepare_cover_art(url, mbid=None, cache=None, max_dimension=TARGET_DIMENSION):
+    """Return upload-ready JPEG bytes for `url`, from `cache` when this MBID was processed before."""
+    key = f"{mbid}-{max_dimension}" if mbid else None
+    if cache and key:
+        cached = cache.get(key)
+        metrics.cache_result('image', cached is not None)
+        if cached is not None:
+            return cached
+    with metrics.stage('image_download'):
+        raw = download_image(url)
+    with metrics.stage('image_encode'):
+        data = encode_for_upload(raw, max_dimension=max_dimension)
+    if cache and key:
+        cache.put(key, data)
+    return data
@@ -0,0 +1,118 @@
+import re
+import unicodedata
+
+MAX_TAG_LENGTH = 64
+
+URL_RE = re.compile(r'(?:^|(?<=[\s(]))(https?://[^\s]+)', re.IGNORECASE)
+TAG_RE = re.compile(r'(?:^|(?<=\s))[#\uff03]([^\s\u00ad\u2060\u200a\u200b\u200c\u200d\u20e2]+)')
+MENTION_RE = re.compile(
+    r'(?:^|(?<=[\s(]))@((?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)'
+)
+TRAILING_URL_PUNCTUATION = '.,;:!?"\''
+
+
+def is_punctuation(char):
+    return unicodedata.category(char).startswith('P')
+
+
+def byte_offsets(text, positions):
+    """Map character offsets in `text` to UTF-8 byte offsets in one left-to-right pass.
+
+    Each stretch of text between consecutive offsets is encoded exactly once,
+    so the cost is linear in the length of the text however many offsets are
+    asked for (rather than re-encoding a prefix per offset).
+    """
+    offsets = {}
+    previous = 0
+    position = 0
+    for offset in sorted(set(positions)):
+        position += len(text[previous:offset].encode('utf-8'))
+        offsets[offset] = position
+        previous = offset
+    return offsets
+
+
+def find_links(text):
+    for match in URL_RE.finditer(text):
+        url = match.group(1)
+        # Sentence punctuation right after a link is not part of it, nor is an
+        # unbalanced closing parenthesis.
+        url = url.rstrip(TRAILING_URL_PUNCTUATION)
+        if url.endswith(')') and url.count('(') < url.count(')'):
+            url = url[:-1].rstrip(TRAILING_URL_PUNCTUATION)
+        if len(url) > len('https://'):
+            yield match.start(1), match.start(1) + len(url), url
+
+
+def find_tags(text):
+    """Yield hashtags following Bluesky's rules.
+
+    A tag starts at the beginning of the text or after whitespace, loses any
+    trailing punctuation, must contain something other than digits and
+    punctuation (so chart positions like "#1" are not tags) and is at most
+    64 characters long.
+    """
+    for match in TAG_RE.finditer(text):
+        tag = match.group(1)
+        end = len(tag)
+        while end and is_punctuation(tag[end - 1]):
+            end -= 1
+        tag = tag[:end]
+        if not tag or len(tag) > MAX_TAG_LENGTH or tag.startswith('\ufe0f'):
+            continue
+        if all(char.isdigit() or is_punctuation(char) for char in tag):
+            continue
+        yield match.start(), match.start(1) + end, tag
+
+
+def find_mentions(text):
+    for match in MENTION_RE.finditer(text):
+        yield match.start(), match.end(), match.group(1).lower()
+
+
+def find_facet_spans(text):
+    """Return (kind, byte_start, byte_end, value) for every link, tag and mention in `text`.
+
+    `kind` is 'link', 'tag' or 'mention'. Character offsets are collected
+    first and converted to byte offsets together by `byte_offsets`.
+    """
+    found = [('link', start, end, url) for start, end, url in find_links(text)]
+    links = [(start, end) for _, start, end, _ in found]
+
+    def inside_link(start):
+        return any(link_start <= start < link_end for link_start, link_end in links)
+
+    found.extend(('tag', start, end, tag) for start, end, tag in find_tags(text) if not inside_link(start))
+    found.extend(('mention', start, end, handle) for start, end, handle in find_mentions(text)
+                 if not inside_link(start))
+
+    offsets = byte_offsets(text, [offset for _, start, end, _ in found for offset in (start, end)])
+    spans = [(kind, offsets[start], offsets[end], value) for kind, start, end, value in found]
+    spans.sort(key=lambda span: span[1])
+    return spans
+
+
+def build_facets(text, resolve_handle=None):
+    """Build AppBskyRichtextFacet objects for `text`.
+
+    Mentions need a DID, so they are only emitted when `resolve_handle`
+    (handle -> DID or None) is given and resolves the handle.
+    """
+    from atproto import models as atproto_models
+
+    facet = atproto_models.AppBskyRichtextFacet
+    facets = []
+    for kind, byte_start, byte_end, value in find_facet_spans(text):
+        if kind == 'link':
+            feature = facet.Link(uri=value)
+        elif kind == 'tag':
+            feature = facet.Tag(tag=value)
+        else:
+            did = resolve_handle(value) if resolve_handle else None
+            if not did:
+                continue
+            feature = facet.Mention(did=did)
+        facets.append(
+            facet.Main(features=[feature], index=facet.ByteSlice(byteStart=byte_start, byteEnd=byte_end))
+        )
+    return facets
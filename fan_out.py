@@ -0,0 +1,84 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from template_engine import TemplatePool
+
+FEED_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
+
+class Feed:
+    """One Bluesky account in a fan-out: which songs it takes, how it words them and how it logs in.
+
+    A feed with no `tags` takes every song; otherwise a song needs at least
+    one of them from tag_song. `templates` maps tags to template sources in
+    the same form as templates.py and replaces the default templates for
+    this feed. Credentials are read from `<ENV_PREFIX>_BLUESKY_USERNAME` and
+    `<ENV_PREFIX>_BLUESKY_PASSWORD`, the prefix defaulting to the upper-cased
+    feed name.
+    """
+
+    def __init__(self, name, tags=(), templates=None, fallback_templates=None, env_prefix=None):
+        if not FEED_NAME_RE.match(name or ''):
+            raise ValueError(f"Invalid feed name {name!r}: use lowercase letters, digits, '-' and '_'.")
+        self.name = name
+        self.tags = frozenset(tags)
+        self.pools = {tag: TemplatePool(sources) for tag, sources in templates.items()} if templates else None
+        self.fallback_pool = TemplatePool(fallback_templates) if fallback_templates else None
+        self.env_prefix = env_prefix or re.sub(r'[^A-Z0-9]+', '_', name.upper())
+
+    def accepts(self, song_tags):
+        return not self.tags or not self.tags.isdisjoint(song_tags)
+
+    def credentials(self, environ=os.environ):
+        return (environ.get(f"{self.env_prefix}_BLUESKY_USERNAME"),
+                environ.get(f"{self.env_prefix}_BLUESKY_PASSWORD"))
+
+    def session_path(self, state_dir):
+        return os.path.join(state_dir, 'sessions', self.name)
+
+
+def load_feeds(path):
+    """Read feed definitions from a JSON file of the form {"feeds": [{"name": ..., ...}, ...]}."""
+    with open(path) as f:
+        data = json.load(f)
+    feeds = []
+    for entry in data.get('feeds', []):
+        feeds.append(Feed(
+            entry.get('name'),
+            tags=entry.get('tags', ()),
+            templates=entry.get('templates'),
+            fallback_templates=entry.get('fallback_templates'),
+            env_prefix=entry.get('env_prefix'),
+        ))
+    names = [feed.name for feed in feeds]
+    if not feeds:
+        raise ValueError(f"No feeds defined in {path}.")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate feed names in {path}.")
+    return feeds
+
+
+def feed_tag_weights(feeds):
+    """Catalog tag weights that only draw songs some feed takes, or None if a feed takes everything."""
+    if any(not feed.tags for feed in feeds):
+        return None
+    return {tag: 1.0 for feed in feeds for tag in sorted(feed.tags)}
+
+
+def publish_all(feeds, publish):
+    """Call `publish(feed)` for every feed concurrently; returns {feed name: True/False}.
+
+    An exception from one feed is reported and counted as a failure without
+    affecting the others.
+    """
+    def run(feed):
+        try:
+            return bool(publish(feed))
+        except Exception as e:
+            print(f"🚫 [{feed.name}] Error: Failed to create Bluesky post: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, len(feeds))) as pool:
+        return dict(zip([feed.name for feed in feeds], pool.map(run, feeds)))
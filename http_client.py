@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import metrics
+
+USER_AGENT = 'PopHits Bluesky Automation Script (pophits.org)'
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_METHODS = {'GET', 'HEAD'}
+
+# Minimum seconds between requests per host. MusicBrainz allows 1 req/s.
+DEFAULT_RATE_LIMITS = {
+    'musicbrainz.org': 1.0,
+}
+
+
+class RateLimiter:
+    """Spaces out calls so that at most one starts every `interval` seconds, across threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds requested by a Retry-After header, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Shared HTTP layer: one pooled keep-alive Session per host, default timeouts,
+    retries with exponential backoff and jitter, Retry-After support and per-host
+    rate limiting.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_retries=3, backoff_base=0.5, backoff_max=30.0,
+                 rate_limits=None, pool_size=10):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._limiters = {host: RateLimiter(interval)
+                          for host, interval in (DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits).items()}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                self._sessions[host] = session
+            return session
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, delay)  # "full jitter"
+
+    def request(self, method, url, **kwargs):
+        import requests
+
+        method = method.upper()
+        host = urlsplit(url).hostname or ''
+        session = self._session(host)
+        limiter = self._limiters.get(host)
+        kwargs.setdefault('timeout', self.timeout)
+        retries = self.max_retries if method in RETRY_METHODS else 0
+
+        for attempt in range(retries + 1):
+            if limiter:
+                limiter.wait()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                if not kwargs.get('stream'):
+                    metrics.add_bytes(host, 'in', len(response.content))
+                return response
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            if delay is None:
+                delay = self._backoff(attempt)
+            response.close()
+            print(f"Retrying {host} after HTTP {response.status_code} in {delay:.1f}s")
+            time.sleep(min(delay, self.backoff_max))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+default_client = HttpClient()
+
+
+def get(url, **kwargs):
+    return default_client.get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return default_client.head(url, **kwargs)
@@ -0,0 +1,119 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Returned by the getters when nothing usable is cached, so that a cached
+# negative result (None) can be told apart from a cache miss.
+MISS = object()
+
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def normalize_key(artist, title):
+    """Build a cache key that ignores case, accents, punctuation and spacing."""
+    def clean(value):
+        value = unicodedata.normalize('NFKD', value or '')
+        value = ''.join(c for c in value if not unicodedata.combining(c))
+        value = re.sub(r'[^\w\s]', ' ', value.casefold())
+        return ' '.join(value.split())
+    return f"{clean(artist)}\x1f{clean(title)}"
+
+
+class LookupCache:
+    """SQLite-backed cache of MusicBrainz release IDs and whether their releases have front cover art.
+
+    Positive results are kept until evicted. Negative results (no release, no
+    cover art) expire after `negative_ttl` seconds. Each table is capped at
+    `max_entries` rows, evicting the least recently used rows first.
+    """
+
+    def __init__(self, path, negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS release_ids (
+                key TEXT PRIMARY KEY,
+                mbid TEXT,
+                stored_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS front_art (
+                mbid TEXT PRIMARY KEY,
+                has_front INTEGER,
+                stored_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS release_ids_used_at ON release_ids (used_at);
+            CREATE INDEX IF NOT EXISTS front_art_used_at ON front_art (used_at);
+        """)
+        # Older caches stored the full cover art URL, which goes stale when the
+        # Cover Art Archive base or thumbnail size changes. Keep only the flag.
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cover_art'").fetchone():
+            self._conn.executescript("""
+                INSERT OR IGNORE INTO front_art (mbid, has_front, stored_at, used_at)
+                    SELECT mbid, CASE WHEN url IS NULL THEN NULL ELSE 1 END, stored_at, used_at FROM cover_art;
+                DROP TABLE cover_art;
+            """)
+        self._conn.commit()
+
+    def _get(self, table, key_column, value_column, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {value_column}, stored_at FROM {table} WHERE {key_column} = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISS
+            value, stored_at = row
+            if value is None and now - stored_at > self.negative_ttl:
+                self._conn.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+                self._conn.commit()
+                return MISS
+            self._conn.execute(f"UPDATE {table} SET used_at = ? WHERE {key_column} = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def _put(self, table, key_column, value_column, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, {value_column}, stored_at, used_at) "
+                f"VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE {key_column} IN "
+                    f"(SELECT {key_column} FROM {table} ORDER BY used_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def get_release_id(self, artist, title):
+        return self._get('release_ids', 'key', 'mbid', normalize_key(artist, title))
+
+    def put_release_id(self, artist, title, mbid):
+        self._put('release_ids', 'key', 'mbid', normalize_key(artist, title), mbid)
+
+    def get_has_front_art(self, mbid):
+        """Return True or False for a cached Cover Art Archive result, or MISS."""
+        has_front = self._get('front_art', 'mbid', 'has_front', mbid)
+        return has_front if has_front is MISS else bool(has_front)
+
+    def put_has_front_art(self, mbid, has_front):
+        # Stored as 1 or NULL, so "no front art" expires like the other negative results.
+        self._put('front_art', 'mbid', 'has_front', mbid, 1 if has_front else None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,208 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds, shared by every stage histogram.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_PREFIX = 'pophits'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_json(self):
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'count': self.count, 'sum': self.sum}
+
+    @classmethod
+    def from_json(cls, data):
+        histogram = cls(tuple(data['buckets']))
+        histogram.counts, histogram.count, histogram.sum = list(data['counts']), data['count'], data['sum']
+        return histogram
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+
+def atomic_write_text(path, text, mode=0o644):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+
+class Metrics:
+    """Per-run stage timings, byte counters, cache hit/miss counts and outcome.
+
+    Thread-safe, since stages run concurrently in the candidate pipeline.
+    Write the results with `write_jsonl` (one JSON object per run) and/or
+    `write_prometheus` (a textfile for the node exporter's textfile collector).
+    A long-running process calls `reset` after exporting, so each export
+    covers one run.
+
+    Stage latency is exported as a Prometheus histogram. Its buckets, sum and
+    count have to keep growing across cron processes, so every export adds
+    the run's histograms to running totals kept in a JSON file
+    (`histogram_path`) and writes those totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {}
+            self.stage_errors = {}
+            self.bytes = {}
+            self.cache = {}
+            self.outcome = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self.stage_errors[name] = self.stage_errors.get(name, 0) + 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages.setdefault(name, Histogram()).observe(elapsed)
+
+    def add_bytes(self, host, direction, count):
+        key = (host, direction)
+        with self._lock:
+            self.bytes[key] = self.bytes.get(key, 0) + count
+
+    def cache_result(self, cache, hit):
+        with self._lock:
+            hits, misses = self.cache.get(cache, (0, 0))
+            self.cache[cache] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def set_outcome(self, outcome):
+        self.outcome = outcome
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timestamp': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'outcome': self.outcome,
+                'stages': {
+                    name: {'count': h.count, 'total_seconds': round(h.sum, 6), 'errors': self.stage_errors.get(name, 0)}
+                    for name, h in self.stages.items()
+                },
+                'bytes': {f"{host} {direction}": count for (host, direction), count in self.bytes.items()},
+                'cache': {
+                    name: {'hits': hits, 'misses': misses,
+                           'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None}
+                    for name, (hits, misses) in self.cache.items()
+                },
+            }
+
+    def write_jsonl(self, path):
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot(), sort_keys=True) + '\n')
+
+    def add_to_totals(self, path):
+        """Add this run's stage histograms to the totals in `path` and return the new totals.
+
+        The file is locked while it is updated, so runs that overlap can't
+        lose each other's observations. A stage whose stored buckets differ
+        from the current ones starts over, which Prometheus treats as a reset.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    stored = json.load(f)
+            except (FileNotFoundError, ValueError):
+                stored = {}
+            totals = {name: Histogram.from_json(data) for name, data in stored.items()}
+            with self._lock:
+                for name, histogram in self.stages.items():
+                    total = totals.get(name)
+                    if total is None or total.buckets != histogram.buckets:
+                        total = totals[name] = Histogram(histogram.buckets)
+                    total.merge(histogram)
+            atomic_write_text(path, json.dumps({name: h.to_json() for name, h in totals.items()}, sort_keys=True))
+        return totals
+
+    def prometheus_text(self, histograms=None):
+        """Textfile contents; `histograms` are the stage totals to export (this run's when omitted)."""
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Time spent in each pipeline stage.",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted((histograms if histograms is not None else self.stages).items()):
+                cumulative = 0
+                for bound, count in zip([str(b) for b in h.buckets] + ['+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{p}_stage_duration_seconds_sum{{stage="{name}"}} {h.sum:.6f}')
+                lines.append(f'{p}_stage_duration_seconds_count{{stage="{name}"}} {h.count}')
+            # The rest describes the last run only, so these are gauges.
+            lines += [f"# HELP {p}_stage_errors Stage failures in the last run.",
+                      f"# TYPE {p}_stage_errors gauge"]
+            lines += [f'{p}_stage_errors{{stage="{name}"}} {count}'
+                      for name, count in sorted(self.stage_errors.items())]
+            lines += [f"# HELP {p}_bytes Bytes transferred in the last run.",
+                      f"# TYPE {p}_bytes gauge"]
+            lines += [f'{p}_bytes{{host="{host}",direction="{direction}"}} {count}'
+                      for (host, direction), count in sorted(self.bytes.items())]
+            lines += [f"# HELP {p}_cache_requests Cache lookups in the last run.",
+                      f"# TYPE {p}_cache_requests gauge"]
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'{p}_cache_requests{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'{p}_cache_requests{{cache="{name}",result="miss"}} {misses}')
+            lines += [f"# HELP {p}_last_run_timestamp_seconds Start time of the last run, by outcome.",
+                      f"# TYPE {p}_last_run_timestamp_seconds gauge",
+                      f'{p}_last_run_timestamp_seconds{{outcome="{self.outcome or "unknown"}"}} {self.started_at:.0f}',
+                      f"# HELP {p}_last_run_duration_seconds Duration of the last run.",
+                      f"# TYPE {p}_last_run_duration_seconds gauge",
+                      f"{p}_last_run_duration_seconds {time.time() - self.started_at:.6f}"]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, histogram_path=None):
+        """Write the textfile atomically so the node exporter never reads a partial file.
+
+        With `histogram_path`, the stage histograms are the running totals
+        kept there (see `add_to_totals`) rather than this run's alone.
+        """
+        histograms = self.add_to_totals(histogram_path) if histogram_path else None
+        atomic_write_text(path, self.prometheus_text(histograms))
+
+
+metrics = Metrics()
+
+
+def export(jsonl_path=None, textfile_path=None, histogram_path=None):
+    if jsonl_path:
+        metrics.write_jsonl(jsonl_path)
+    if textfile_path:
+        metrics.write_prometheus(textfile_path, histogram_path)
@@ -0,0 +1,151 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+import http_client
+
+MIN_SCORE = 0.75
+MAX_COVER_ART_PROBES = 3
+SEARCH_LIMIT = 10
+
+FEATURING_RE = re.compile(r'\s+(?:feat\.?|featuring|ft\.?|with)\s+.*$', re.IGNORECASE)
+TITLE_FEATURING_RE = re.compile(r'\s*[(\[](?:feat\.?|featuring|ft\.?)\s[^)\]]*[)\]]', re.IGNORECASE)
+PARENTHETICAL_RE = re.compile(r'\s*[(\[][^)\]]*[)\]]')
+LUCENE_ESCAPE_RE = re.compile(r'([\\"])')
+
+# (entity, extra query clause) in the order they are tried. Singles are
+# matched on the release title; albums and the unrestricted fallback go
+# through recording search, since an album's title is not the track's.
+QUERY_CASCADE = (
+    ('release', 'primarytype:single'),
+    ('recording', 'primarytype:album'),
+    ('recording', None),
+)
+
+
+def normalize(text):
+    """Casefold, strip diacritics and punctuation, and drop a leading "the"."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.casefold().replace('&', ' and ')
+    text = ' '.join(re.sub(r"[^\w\s]|_", ' ', text.replace("'", '').replace('’', '')).split())
+    return text[4:] if text.startswith('the ') else text
+
+
+def primary_artist(artist):
+    return FEATURING_RE.sub('', artist or '')
+
+
+def title_variants(title):
+    without_featuring = TITLE_FEATURING_RE.sub('', title or '')
+    return {normalize(t) for t in (title, without_featuring, PARENTHETICAL_RE.sub('', without_featuring))} - {''}
+
+
+def similarity(a, b):
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def credit_names(artist_credit):
+    """Both the full credit ("A feat. B") and the first credited artist."""
+    if not artist_credit:
+        return set()
+    full = ''.join(c.get('name', '') + c.get('joinphrase', '') for c in artist_credit)
+    return {normalize(full), normalize(artist_credit[0].get('name', ''))} - {''}
+
+
+def match_score(title, artist, candidate_title, candidate_credit):
+    """Fuzzy 0..1 score of how well a MusicBrainz title and artist credit match ours."""
+    title_score = max((similarity(ours, theirs) for ours in title_variants(title)
+                       for theirs in title_variants(candidate_title)), default=0.0)
+    ours = {normalize(artist), normalize(primary_artist(artist))} - {''}
+    artist_score = max((similarity(a, b) for a in ours for b in credit_names(candidate_credit)), default=0.0)
+    return 0.6 * title_score + 0.4 * artist_score
+
+
+def lucene_phrase(value):
+    return '"' + LUCENE_ESCAPE_RE.sub(r'\\\1', value) + '"'
+
+
+def front_art_flag(release):
+    """True/False when the search result says whether the release has front art, None if unknown."""
+    flags = release.get('cover-art-archive')
+    if not flags:
+        return None
+    return bool(flags.get('front'))
+
+
+class ReleaseMatcher:
+    """Finds the best MusicBrainz release for a track, preferring releases with cover art.
+
+    Queries in QUERY_CASCADE are tried in order and stop as soon as one yields
+    a good enough match with cover art, since every query costs a second of
+    MusicBrainz rate limit. Results are scored with normalized fuzzy matching
+    on title and artist. `probe_cover_art(mbid, front_flag)` is called for
+    candidates best-first and returns a cover art URL or None. `front_flag`
+    comes from the `cover-art-archive` block in the search result when present,
+    so the probe can skip the Cover Art Archive request.
+    """
+
+    def __init__(self, api_base, probe_cover_art, min_score=MIN_SCORE, max_probes=MAX_COVER_ART_PROBES):
+        self.api_base = api_base.rstrip('/')
+        self.probe_cover_art = probe_cover_art
+        self.min_score = min_score
+        self.max_probes = max_probes
+
+    def search(self, entity, query):
+        response = http_client.get(
+            f"{self.api_base}/{entity}/", params={'query': query, 'fmt': 'json', 'limit': SEARCH_LIMIT}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def candidates(self, entity, data, artist, title):
+        """Yield (score, mbid, front_flag) for every release in a search response."""
+        if entity == 'release':
+            for release in data.get('releases', []):
+                score = match_score(title, artist, release.get('title'), release.get('artist-credit'))
+                yield score, release['id'], front_art_flag(release)
+            return
+        for recording in data.get('recordings', []):
+            score = match_score(title, artist, recording.get('title'), recording.get('artist-credit'))
+            for release in recording.get('releases', []):
+                # Prefer official releases over bootlegs and promos.
+                penalty = 0.05 if release.get('status') not in (None, 'Official') else 0.0
+                yield score - penalty, release['id'], front_art_flag(release)
+
+    def find_release(self, artist, title):
+        """Return the MBID of the best matching release, preferring one with cover art.
+
+        Falls back to the best match without art, or None if nothing scores
+        above `min_score`. Raises requests exceptions on HTTP failures so that
+        callers don't cache a transient miss.
+        """
+        base_query = f"artist:{lucene_phrase(primary_artist(artist))}"
+        probes = 0
+        seen = set()
+        best_without_art = None
+        for entity, clause in QUERY_CASCADE:
+            field = 'release' if entity == 'release' else 'recording'
+            query = f"{field}:{lucene_phrase(title)} AND {base_query}"
+            if clause:
+                query += f" AND {clause}"
+            ranked = sorted(self.candidates(entity, self.search(entity, query), artist, title),
+                            key=lambda candidate: -candidate[0])
+            for score, mbid, front_flag in ranked:
+                if score < self.min_score or mbid in seen:
+                    continue
+                seen.add(mbid)
+                if best_without_art is None:
+                    best_without_art = mbid
+                if front_flag is False:
+                    self.probe_cover_art(mbid, False)
+                    continue
+                if front_flag is None:
+                    if probes >= self.max_probes:
+                        continue
+                    probes += 1
+                if self.probe_cover_art(mbid, front_flag):
+                    return mbid
+        return best_without_art
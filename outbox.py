@@ -0,0 +1,134 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+PREPARED = 'prepared'
+BLOB_UPLOADED = 'blob_uploaded'
+POSTED = 'posted'
+ABANDONED = 'abandoned'
+PENDING_STATES = (PREPARED, BLOB_UPLOADED)
+
+MAX_ATTEMPTS = 5
+
+TID_ALPHABET = '234567abcdefghijklmnopqrstuvwxyz'
+
+ENTRY_COLUMNS = (
+    'id', 'account', 'slug', 'song', 'text', 'rkey', 'state', 'blob', 'blob_uploaded_at', 'uri', 'attempts',
+    'last_error', 'created_at',
+)
+
+
+def new_tid(now=None, clock_id=None):
+    """Return an AT Protocol TID (timestamp identifier) to use as a record key."""
+    micros = int((now if now is not None else time.time()) * 1_000_000)
+    value = (micros << 10) | (random.getrandbits(10) if clock_id is None else clock_id)
+    chars = []
+    for _ in range(13):
+        chars.append(TID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+class Outbox:
+    """Durable SQLite record of every post from preparation to publication.
+
+    Each entry moves prepared -> blob_uploaded -> posted, and every step is
+    committed as soon as it succeeds. The record key is fixed when the entry
+    is created, so publishing again after a crash can't create a second post.
+    Entries that fail MAX_ATTEMPTS times are marked abandoned.
+    """
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account TEXT NOT NULL,
+                slug TEXT NOT NULL,
+                song TEXT NOT NULL,
+                text TEXT NOT NULL,
+                rkey TEXT NOT NULL,
+                state TEXT NOT NULL,
+                blob TEXT,
+                blob_uploaded_at REAL,
+                uri TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_account_state ON outbox (account, state);
+        """)
+        self._conn.commit()
+
+    def _update(self, entry_id, **changes):
+        changes['updated_at'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in changes)
+        with self._lock:
+            self._conn.execute(f"UPDATE outbox SET {assignments} WHERE id = ?", (*changes.values(), entry_id))
+            self._conn.commit()
+        return self.get(entry_id)
+
+    def add(self, account, song, text):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (account, slug, song, text, rkey, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, song['slug'], json.dumps(song), text, new_tid(now), PREPARED, now, now),
+            )
+            self._conn.commit()
+        return self.get(cursor.lastrowid)
+
+    def get(self, entry_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(ENTRY_COLUMNS)} FROM outbox WHERE id = ?", (entry_id,)
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def pending(self, account):
+        """Entries for `account` that were prepared but not yet posted, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(ENTRY_COLUMNS)} FROM outbox WHERE account = ? AND state IN (?, ?) ORDER BY id",
+                (account, *PENDING_STATES),
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def mark_blob_uploaded(self, entry_id, blob, uploaded_at=None):
+        return self._update(entry_id, state=BLOB_UPLOADED, blob=json.dumps(blob),
+                            blob_uploaded_at=uploaded_at or time.time())
+
+    def mark_posted(self, entry_id, uri):
+        return self._update(entry_id, state=POSTED, uri=uri, last_error=None)
+
+    def record_failure(self, entry_id, error):
+        """Count a failed step; the entry is abandoned once it has failed `max_attempts` times."""
+        entry = self.get(entry_id)
+        attempts = entry['attempts'] + 1
+        changes = {'attempts': attempts, 'last_error': str(error)}
+        if attempts >= self.max_attempts:
+            changes['state'] = ABANDONED
+        return self._update(entry_id, **changes)
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry = dict(row)
+        entry['song'] = json.loads(entry['song'])
+        entry['blob'] = json.loads(entry['blob']) if entry['blob'] else None
+        return entry
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
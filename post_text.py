@@ -0,0 +1,123 @@
+import random
+import re
+from datetime import datetime
+
+import template_engine
+
+POST_CHAR_LIMIT = 300
+ELLIPSIS = '…'
+TIMELESS_AGE = 50
+LONGEVITY_WEEKS = 30
+SHORT_RUN_WEEKS = 5
+
+DECADE_TAGS = (
+    ("sixties", 1960, 1970),
+    ("seventies", 1970, 1980),
+    ("eighties", 1980, 1990),
+    ("nineties", 1990, 2000),
+    ("two_thousands", 2000, 2010),
+)
+
+def tag_song(song, current_year=None):
+    tags = []
+    if current_year is None:
+        current_year = datetime.now().year
+    year = song["year"]
+    peak = song["peak_rank"]
+    weeks = song["weeks_on_chart"]
+
+    if peak == 1:
+        tags.append("number_one")
+    elif peak <= 10:
+        tags.append("top_ten")
+    if weeks >= LONGEVITY_WEEKS:
+        tags.append("longevity")
+    if weeks < SHORT_RUN_WEEKS:
+        tags.append("short_run")
+    if year <= current_year - TIMELESS_AGE:
+        tags.append("timeless")
+    for tag, start, end in DECADE_TAGS:
+        if start <= year < end:
+            tags.append(tag)
+            break
+    return tags
+
+emoji_map = {
+    "number_one": "🏆",
+    "top_ten": "🔥",
+    "longevity": "📈",
+    "short_run": "💨",
+    "timeless": "🎶",
+    "sixties": "🕺",
+    "seventies": "🌈",
+    "eighties": "🎧",
+    "nineties": "💿",
+    "two_thousands": "📻",
+}
+
+def generate_hashtags(song):
+    base_tags = ["#pophits", "#Hot100", "#Billboard"]
+    artist_tag = f"#" + re.sub(r'[^a-zA-Z0-9]', '', song['artist'])
+    return " ".join(base_tags + [artist_tag])
+
+def shorten_values(template, values, target):
+    """Truncate the title, then the artist, so `template` renders in at most `target` characters.
+
+    Returns the shortened values, or None if even one-character fields don't fit.
+    """
+    values = dict(values)
+    counts = dict(template.placeholders)
+    excess = template.length({field: len(value) for field, value in values.items()}) - target
+    for field in ('title', 'artist'):
+        count = counts.get(field)
+        if excess <= 0 or not count:
+            continue
+        value = values[field]
+        length = max(1, len(value) - -(-excess // count))
+        if length < len(value):
+            values[field] = value[:length - 1].rstrip() + ELLIPSIS
+            excess -= (len(value) - len(values[field])) * count
+    return values if excess <= 0 else None
+
+def compose_post(values, slug, hashtags, tags, rng=random, pools=None, fallback_pool=None, selector=None,
+                 fitting_cache=None):
+    """Build post text from precomputed field strings and hashtags, with `tags` already in order.
+
+    Returns (tag, template, text). Shared by generate_post and the bulk path
+    in bulk_posts, which precomputes the strings once per distinct value.
+    """
+    closing = f" Check it out at https://pophits.org/songs/{slug}!\n{hashtags}"
+    # Code points are never fewer than graphemes, so this also respects
+    # Bluesky's 300-grapheme limit.
+    budget = POST_CHAR_LIMIT - len(closing)
+
+    tag, template, values = template_engine.choose_template(
+        tags, values, budget, emoji_map, rng, pools, fallback_pool, selector, fitting_cache
+    )
+    text = template.render(values)
+    if len(text) <= budget:
+        return tag, template, text + closing
+    # Nothing fits as is (very long title or artist): shorten the fields
+    # rather than publish a post Bluesky would reject.
+    shortened = shorten_values(template, values, budget)
+    if shortened:
+        return tag, template, template.render(shortened) + closing
+    if len(text) > POST_CHAR_LIMIT:
+        shortened = shorten_values(template, values, POST_CHAR_LIMIT)
+        text = template.render(shortened) if shortened else text[:POST_CHAR_LIMIT - len(ELLIPSIS)] + ELLIPSIS
+    return tag, template, text
+
+def generate_post(song, tags=None, rng=random, pools=None, fallback_pool=None, selector=None, record_usage=True):
+    tags = tag_song(song) if tags is None else list(tags)
+    if selector:
+        tags = selector.order_tags(tags, rng)
+    else:
+        rng.shuffle(tags)
+
+    tag, template, text = compose_post(
+        template_engine.field_values(song), song['slug'], generate_hashtags(song), tags, rng,
+        pools, fallback_pool, selector,
+    )
+    if selector and record_usage:
+        selector.record(tag, template)
+    return text
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+import time
+
+DAY = 24 * 3600
+
+
+def artist_key(artist):
+    return ' '.join((artist or '').casefold().split())
+
+
+class PostedLedger:
+    """Append-only SQLite history of posted songs.
+
+    Checking a candidate is two indexed lookups of the latest post of its
+    slug and its artist, so opening the ledger and checking a candidate cost
+    the same no matter how many years of history it holds.
+    """
+
+    def __init__(self, path, slug_window_days=365, artist_window_days=14):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.slug_window = slug_window_days * DAY
+        self.artist_window = artist_window_days * DAY
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posted (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                slug TEXT NOT NULL,
+                artist_key TEXT NOT NULL,
+                posted_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS posted_posted_at ON posted (posted_at);
+            CREATE INDEX IF NOT EXISTS posted_slug ON posted (slug);
+            CREATE INDEX IF NOT EXISTS posted_artist_key ON posted (artist_key, posted_at);
+        """)
+        self._conn.commit()
+
+    def _last_posted(self, column, value):
+        row = self._conn.execute(f"SELECT MAX(posted_at) FROM posted WHERE {column} = ?", (value,)).fetchone()
+        return row[0]
+
+    def rejection_reason(self, song, now=None):
+        """Return why `song` was posted too recently, or None if it may be posted."""
+        now = now or time.time()
+        with self._lock:
+            slug_posted = self._last_posted('slug', song["slug"])
+            artist_posted = self._last_posted('artist_key', artist_key(song["artist"]))
+        if slug_posted and now - slug_posted < self.slug_window:
+            return "song posted recently"
+        if artist_posted and now - artist_posted < self.artist_window:
+            return "artist posted recently"
+        return None
+
+    def record(self, song, posted_at=None):
+        posted_at = posted_at or time.time()
+        key = artist_key(song["artist"])
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO posted (slug, artist_key, posted_at) VALUES (?, ?, ?)",
+                (song["slug"], key, posted_at),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
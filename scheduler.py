@@ -0,0 +1,54 @@
+import time
+from collections import deque
+
+# Blobs that no record references are garbage-collected by the PDS, so an
+# uploaded image is only trusted for this long before it is re-uploaded.
+BLOB_MAX_AGE = 30 * 60
+
+
+class PostScheduler:
+    """Publishes prepared posts on a fixed cadence from a queue that is filled ahead of time.
+
+    `prepare_next(queued_songs)` returns the next prepared post (a dict with
+    at least `song`, `blob` and `blob_uploaded_at`) that isn't one of the
+    songs already queued, or None;
+    `refresh_blob(prepared)` re-uploads a stale image and `publish(prepared)`
+    posts it; both return True on success. All network work for the next post
+    happens right after the previous publish, not on the publish path.
+    """
+
+    def __init__(self, prepare_next, refresh_blob, publish, interval, queue_size=3):
+        self.prepare_next = prepare_next
+        self.refresh_blob = refresh_blob
+        self.publish = publish
+        self.interval = interval
+        self.queue_size = queue_size
+        self.queue = deque()
+
+    def fill(self):
+        while len(self.queue) < self.queue_size:
+            prepared = self.prepare_next([p['song'] for p in self.queue])
+            if not prepared:
+                print("⚠️ Could not prepare another post; will try again after the next publish.")
+                break
+            self.queue.append(prepared)
+            print(f"📥 Queued '{prepared['song']['title']}' ({len(self.queue)}/{self.queue_size})")
+
+    def run(self, max_posts=None):
+        published = 0
+        next_publish = time.monotonic()
+        while max_posts is None or published < max_posts:
+            self.fill()
+            delay = next_publish - time.monotonic()
+            if delay > 0:
+                print(f"⏳ Next post in {delay:.0f}s")
+                time.sleep(delay)
+            next_publish = max(next_publish + self.interval, time.monotonic())
+            if not self.queue:
+                continue
+            prepared = self.queue.popleft()
+            if time.time() - prepared['blob_uploaded_at'] > BLOB_MAX_AGE and not self.refresh_blob(prepared):
+                continue
+            if self.publish(prepared):
+                published += 1
+        return published
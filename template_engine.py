@@ -0,0 +1,160 @@
+import random
+from bisect import bisect_right
+from collections import Counter
+from string import Formatter
+
+from templates import TEMPLATES, FALLBACK_TEMPLATES
+
+FIELDS = ('title', 'artist', 'year', 'peak_rank', 'weeks_on_chart', 'emoji')
+
+# Text generate_post adds when a template leaves out the song, the year or
+# the chart position. Their lengths are part of each template's budget.
+INTRO = '"{title}" by {artist} '
+YEAR_SUFFIX = ' Released in {year}'
+PEAK_SUFFIX = ' Peaked at #{peak_rank} on the charts'
+
+
+def parse(source):
+    """Split a format string into (literal, field) segments and its fixed literal length."""
+    segments = []
+    fixed_length = 0
+    for literal, field, _, _ in Formatter().parse(source):
+        if literal:
+            segments.append((literal, None))
+            fixed_length += len(literal)
+        if field is not None:
+            if field not in FIELDS:
+                raise ValueError(f"Unknown placeholder {{{field}}} in template: {source}")
+            segments.append((None, field))
+    return segments, fixed_length
+
+
+class CompiledTemplate:
+    """A template parsed once: literal segments, placeholder counts and fixed length.
+
+    The length of a rendered post is `fixed_length` plus the lengths of the
+    substituted values, so whether a template fits can be decided without
+    formatting it.
+    """
+
+    __slots__ = ('source', 'segments', 'placeholders', 'fixed_length')
+
+    def __init__(self, source):
+        self.source = source
+        segments, fixed_length = parse(source)
+        fields = {field for _, field in segments if field}
+        # Mirrors the "always include artist, year and chart position" rules.
+        if 'artist' not in fields and 'title' not in fields:
+            intro_segments, intro_length = parse(INTRO)
+            segments = intro_segments + segments
+            fixed_length += intro_length
+        for suffix, field in ((YEAR_SUFFIX, 'year'), (PEAK_SUFFIX, 'peak_rank')):
+            if field not in fields:
+                suffix_segments, suffix_length = parse(suffix)
+                segments = segments + suffix_segments
+                fixed_length += suffix_length
+        self.segments = tuple(segments)
+        self.placeholders = tuple(sorted(Counter(field for _, field in segments if field).items()))
+        self.fixed_length = fixed_length
+
+    def length(self, value_lengths):
+        return self.fixed_length + sum(value_lengths[field] * count for field, count in self.placeholders)
+
+    def render(self, values):
+        return ''.join(literal if field is None else values[field] for literal, field in self.segments)
+
+
+class TemplatePool:
+    """Templates grouped by placeholder signature and sorted by fixed length.
+
+    Within a group every template's variable part has the same length, so the
+    templates that fit a budget are a prefix found by one bisect per group.
+    """
+
+    def __init__(self, sources):
+        groups = {}
+        for source in sources:
+            template = CompiledTemplate(source)
+            groups.setdefault(template.placeholders, []).append(template)
+        self.groups = []
+        for placeholders, templates in groups.items():
+            templates.sort(key=lambda t: t.fixed_length)
+            self.groups.append((placeholders, [t.fixed_length for t in templates], templates))
+        self.templates = [t for _, _, templates in self.groups for t in templates]
+
+    def fitting(self, value_lengths, budget):
+        """Return the templates whose rendered length is at most `budget`."""
+        fitting = []
+        for placeholders, fixed_lengths, templates in self.groups:
+            variable = sum(value_lengths[field] * count for field, count in placeholders)
+            fitting.extend(templates[:bisect_right(fixed_lengths, budget - variable)])
+        return fitting
+
+    def shortest(self, value_lengths):
+        return min(self.templates, key=lambda t: t.length(value_lengths))
+
+
+TAG_POOLS = {tag: TemplatePool(sources) for tag, sources in TEMPLATES.items()}
+FALLBACK_POOL = TemplatePool(FALLBACK_TEMPLATES)
+
+
+def field_values(song, emoji=''):
+    return {
+        'title': str(song['title']),
+        'artist': str(song['artist']),
+        'year': str(song['year']),
+        'peak_rank': str(song['peak_rank']),
+        'weeks_on_chart': str(song['weeks_on_chart']),
+        'emoji': emoji,
+    }
+
+
+def choose_template(tags, values, budget, emoji_map, rng=random, pools=None, fallback_pool=None, selector=None,
+                    fitting_cache=None):
+    """Pick a template for the first tag (in the given order) that has one fitting `budget`.
+
+    Returns (tag, template, values) with the tag's emoji filled in; the tag is
+    None when a fallback template was used. If nothing fits at all, the
+    shortest fallback template is returned. `pools` and `fallback_pool`
+    replace TAG_POOLS and FALLBACK_POOL, e.g. for a feed with its own templates.
+    With a `selector` (see template_selection), templates used lately are
+    less likely to be picked; otherwise the pick is uniform.
+
+    Which templates fit depends only on the pool, the budget and the value
+    lengths, so callers generating many posts can pass a dict as
+    `fitting_cache` to share those lookups between songs.
+    """
+    pools = TAG_POOLS if pools is None else pools
+    fallback_pool = fallback_pool or FALLBACK_POOL
+    value_lengths = {field: len(value) for field, value in values.items()}
+    lengths_key = (budget, *value_lengths.values()) if fitting_cache is not None else None
+
+    def fitting_templates(pool, emoji_length):
+        value_lengths['emoji'] = emoji_length
+        if fitting_cache is None:
+            return pool.fitting(value_lengths, budget)
+        key = (id(pool), emoji_length, lengths_key)
+        fitting = fitting_cache.get(key)
+        if fitting is None:
+            fitting = fitting_cache[key] = pool.fitting(value_lengths, budget)
+        return fitting
+
+    for tag in tags:
+        pool = pools.get(tag)
+        if not pool:
+            continue
+        emoji = emoji_map.get(tag, '')
+        fitting = fitting_templates(pool, len(emoji))
+        if fitting:
+            template = selector.choose(tag, fitting, len(pool.templates), rng) if selector else rng.choice(fitting)
+            return tag, template, dict(values, emoji=emoji)
+
+    values = dict(values, emoji='')
+    fitting = fitting_templates(fallback_pool, 0)
+    if not fitting:
+        template = fallback_pool.shortest(value_lengths)
+    elif selector:
+        template = selector.choose(None, fitting, len(fallback_pool.templates), rng)
+    else:
+        template = rng.choice(fitting)
+    return None, template, values
@@ -0,0 +1,141 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+FALLBACK_TAG = 'fallback'
+
+# A template's weight rises linearly from MIN_WEIGHT right after it is used
+# to 1 once COOLDOWN_FRACTION of its pool has been used since; a tag's weight
+# does the same over TAG_COOLDOWN posts.
+MIN_WEIGHT = 0.05
+COOLDOWN_FRACTION = 0.5
+TAG_COOLDOWN = 3
+MAX_DRAWS = 32
+
+
+class TemplateSelector:
+    """Recency-weighted template and tag choice, backed by per-template and per-tag usage counts in SQLite.
+
+    Template age is counted in uses of its tag, so a rarely used tag's
+    templates don't all cool down at once. Templates are picked by
+    rejection sampling: a uniform pick from the fitting templates is
+    accepted with probability equal to its weight. A draw takes O(1)
+    expected steps whatever subset of the pool fits the length budget, and
+    recording a use is an O(1) update.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS template_usage (
+                tag TEXT NOT NULL,
+                template TEXT NOT NULL,
+                uses INTEGER NOT NULL,
+                last_tag_use INTEGER NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (tag, template)
+            );
+            CREATE TABLE IF NOT EXISTS tag_usage (
+                tag TEXT PRIMARY KEY,
+                uses INTEGER NOT NULL,
+                last_post INTEGER NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+        # Usage is small (one row per template), so it is kept in memory and only written through.
+        self._templates = {
+            (tag, template): [uses, last_tag_use, last_used_at]
+            for tag, template, uses, last_tag_use, last_used_at in self._conn.execute(
+                "SELECT tag, template, uses, last_tag_use, last_used_at FROM template_usage"
+            )
+        }
+        self._tags = {
+            tag: [uses, last_post, last_used_at]
+            for tag, uses, last_post, last_used_at in self._conn.execute(
+                "SELECT tag, uses, last_post, last_used_at FROM tag_usage"
+            )
+        }
+        # Every post records exactly one tag (FALLBACK_TAG included).
+        self.posts = sum(usage[0] for usage in self._tags.values())
+
+    def template_weight(self, tag, source, pool_size):
+        usage = self._templates.get((tag or FALLBACK_TAG, source))
+        if not usage:
+            return 1.0
+        age = self._tags[tag or FALLBACK_TAG][0] - usage[1]
+        return max(MIN_WEIGHT, min(1.0, age / max(1.0, pool_size * COOLDOWN_FRACTION)))
+
+    def tag_weight(self, tag):
+        usage = self._tags.get(tag)
+        if not usage:
+            return 1.0
+        return max(MIN_WEIGHT, min(1.0, (self.posts - usage[1]) / TAG_COOLDOWN))
+
+    def choose(self, tag, fitting, pool_size, rng=random):
+        """Pick one of the `fitting` templates of `tag`'s pool, favouring those not used lately."""
+        with self._lock:
+            for _ in range(MAX_DRAWS):
+                template = fitting[rng.randrange(len(fitting))]
+                if rng.random() < self.template_weight(tag, template.source, pool_size):
+                    return template
+        return template
+
+    def order_tags(self, tags, rng=random):
+        """Return `tags` in a random order weighted towards tags not used lately."""
+        with self._lock:
+            keys = {tag: rng.random() ** (1 / self.tag_weight(tag)) for tag in tags}
+        return sorted(tags, key=lambda tag: -keys[tag])
+
+    def record(self, tag, template):
+        tag = tag or FALLBACK_TAG
+        now = time.time()
+        with self._lock:
+            self.posts += 1
+            tag_usage = self._tags.setdefault(tag, [0, 0, now])
+            tag_usage[:] = [tag_usage[0] + 1, self.posts, now]
+            template_usage = self._templates.setdefault((tag, template.source), [0, 0, now])
+            template_usage[:] = [template_usage[0] + 1, tag_usage[0], now]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tag_usage (tag, uses, last_post, last_used_at) VALUES (?, ?, ?, ?)",
+                (tag, *tag_usage),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO template_usage (tag, template, uses, last_tag_use, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (tag, template.source, *template_usage),
+            )
+            self._conn.commit()
+
+    def stats(self, pools):
+        """Usage per tag and per template of `pools` ({tag: TemplatePool}), including unused templates."""
+        with self._lock:
+            tags = []
+            for tag, pool in sorted(pools.items()):
+                uses, _, last_used_at = self._tags.get(tag, (0, 0, None))
+                templates = sorted(
+                    ({'template': t.source, 'uses': self._templates.get((tag, t.source), (0,))[0],
+                      'last_used_at': self._templates.get((tag, t.source), (0, 0, None))[2]}
+                     for t in pool.templates),
+                    key=lambda row: (-row['uses'], row['template']),
+                )
+                tags.append({
+                    'tag': tag,
+                    'uses': uses,
+                    'share': uses / self.posts if self.posts else 0.0,
+                    'last_used_at': last_used_at,
+                    'pool_size': len(templates),
+                    'never_used': sum(1 for row in templates if not row['uses']),
+                    'templates': templates,
+                })
+            return {'posts': self.posts, 'tags': tags}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,89 @@
+"""Property tests for facet byte offsets on emoji-heavy text.
+
+Inputs are random; the seed is in every assertion message and can be fixed
+with FACETS_TEST_SEED to replay a failure.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facets import byte_offsets, find_facet_spans  # noqa: E402
+
+SEED = int(os.environ.get('FACETS_TEST_SEED', random.SystemRandom().randrange(2 ** 32)))
+CASES = 300
+
+EMOJI = ['🎸', '🔥', '❤️', '✌🏽', '👩‍🎤', '👨‍👩‍👧', '🏳️‍🌈', '🇺🇸', '🇬🇧', 'é', 'é', 'ß', '全']
+WORDS = ['Song', 'Beyoncé', "Sinéad O'Connor", 'Mötley Crüe', 'by', 'the', '(live)', '—', '!']
+TAGS = ['#rock', '#Hot100!', '#café', '#1', '#42', '#1st', '#🎸', '＃全角', '#Prince.', '#a' * 40]
+LINKS = ['https://pophits.org/songs/song-1', 'https://pophits.org/songs/song-2!',
+         '(https://en.wikipedia.org/wiki/Pop_(music))']
+MENTIONS = ['@pophits.bsky.social', '@Example.COM']
+SEPARATORS = [' ', ' ', '  ', '\n', '']
+
+
+def random_text(rng):
+    tokens = []
+    for _ in range(rng.randint(1, 30)):
+        pool = rng.choice((EMOJI, EMOJI, WORDS, TAGS, LINKS, MENTIONS))
+        token = rng.choice(pool)
+        if pool is TAGS and rng.random() < 0.3:
+            token += rng.choice(EMOJI)
+        tokens.append(token + rng.choice(SEPARATORS))
+    return ''.join(tokens)
+
+
+def expected_fragment(kind, value):
+    return {'link': value, 'tag': f"#{value}", 'mention': f"@{value}"}[kind]
+
+
+def check_spans(text, context):
+    encoded = text.encode('utf-8')
+    for kind, byte_start, byte_end, value in find_facet_spans(text):
+        # Slicing mid-character would make these decodes fail.
+        prefix = encoded[:byte_start].decode('utf-8')
+        fragment = encoded[byte_start:byte_end].decode('utf-8')
+        assert text.startswith(fragment, len(prefix)), context
+        if kind == 'tag':
+            assert fragment[0] in '#＃' and fragment[1:] == value, (fragment, context)
+            assert not all(char.isdigit() for char in value), (value, context)
+        else:
+            assert fragment.lower() == expected_fragment(kind, value).lower(), (fragment, context)
+
+
+@pytest.mark.parametrize('case', range(CASES))
+def test_byte_offsets_match_prefix_encoding(case):
+    rng = random.Random(SEED + case)
+    text = random_text(rng)
+    positions = [rng.randint(0, len(text)) for _ in range(rng.randint(0, 10))]
+    expected = {position: len(text[:position].encode('utf-8')) for position in positions}
+    assert byte_offsets(text, positions) == expected, f"seed {SEED + case}: {text!r}"
+
+
+@pytest.mark.parametrize('case', range(CASES))
+def test_spans_round_trip_to_their_text(case):
+    rng = random.Random(SEED + case)
+    text = random_text(rng)
+    check_spans(text, f"seed {SEED + case}: {text!r}")
+
+
+def test_chart_position_is_not_a_tag():
+    text = "🎸 Hit #1 in 1984 #1! then #1st and #42 🔥 #Hot100"
+    tags = [value for kind, _, _, value in find_facet_spans(text) if kind == 'tag']
+    assert tags == ['1st', 'Hot100']
+
+
+def test_offsets_after_zwj_and_flag_emoji():
+    text = "👩‍🎤🇺🇸 #rock 👨‍👩‍👧 by @pophits.bsky.social 🏳️‍🌈 https://pophits.org/songs/x #pop"
+    spans = find_facet_spans(text)
+    assert [(kind, value) for kind, _, _, value in spans] == [
+        ('tag', 'rock'), ('mention', 'pophits.bsky.social'), ('link', 'https://pophits.org/songs/x'), ('tag', 'pop'),
+    ]
+    for kind, byte_start, byte_end, value in spans:
+        start = text.index(expected_fragment(kind, value))
+        assert byte_start == len(text[:start].encode('utf-8'))
+        assert byte_end - byte_start == len(expected_fragment(kind, value).encode('utf-8'))
+    check_spans(text, text)
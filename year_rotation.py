@@ -0,0 +1,72 @@
+import json
+import os
+import random
+import tempfile
+from datetime import datetime
+
+FIRST_CHART_YEAR = 1958  # first year of the Billboard Hot 100
+
+
+class YearRotation:
+    """Rotates through chart years, keeping the years not yet covered in a JSON list.
+
+    The list order is the rotation order; when every year has been covered
+    the list is refilled with all chart years in a fresh random order. Every
+    change is written with write-to-temp-and-rename, so a crash never leaves
+    a truncated file behind.
+    """
+
+    def __init__(self, path, first_year=FIRST_CHART_YEAR, last_year=None, rng=random):
+        self.path = path
+        self.first_year = first_year
+        self.last_year = last_year or datetime.now().year - 1
+        self.rng = rng
+        self.remaining = self._load()
+        if not self.remaining:
+            self._refill()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable {self.path}: {e}")
+            return []
+        years = []
+        for value in data if isinstance(data, list) else []:
+            if isinstance(value, int) and self.first_year <= value <= self.last_year and value not in years:
+                years.append(value)
+        return years
+
+    def _refill(self):
+        self.remaining = list(range(self.first_year, self.last_year + 1))
+        self.rng.shuffle(self.remaining)
+        self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.remaining, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def next_year(self):
+        return self.remaining[0]
+
+    def mark_covered(self, year):
+        """Remove `year` from the remaining years, refilling once every year is covered."""
+        if year not in self.remaining:
+            return
+        self.remaining.remove(year)
+        if self.remaining:
+            self.save()
+        else:
+            self._refill()